@@ -7,104 +7,481 @@ Provides server-client architecture with feedback support and command tracking.
 
 __version__ = "1.0.1"
 __author__ = "Acquila Team"
-__all__ = ["AcquilaServer", "AcquilaClient", "DEFAULT_OUTBOUND_PORT", "DEFAULT_INBOUND_PORT"]
+__all__ = ["AcquilaServer", "AcquilaClient", "AsyncAcquilaClient", "ClientPool", "client_pool", "CommandStore", "CommandSnapshot",
+           "BatchResult", "SharedAttachment", "open_attachment", "CodecError",
+           "get_codec", "decode_payload", "configure_logging", "DEFAULT_OUTBOUND_PORT", "DEFAULT_INBOUND_PORT"]
 
 import zmq
 import json
 import uuid
 import time
+import queue
+import logging
 import threading
+import collections
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .attach import SharedAttachment, attachment_frame, open_attachment
+from .codec import CodecError, decode_payload, get_codec, peek_progress
+from .log import TRAFFIC_LOGGER, configure_logging
+from .stats import LatencyStats
+from .store import CommandSnapshot, CommandStore
+
+logger = logging.getLogger(__name__)
+traffic_log = logging.getLogger(TRAFFIC_LOGGER) # One line per bus message, DEBUG only
 
 # Default ports
 DEFAULT_OUTBOUND_PORT = 5555
 DEFAULT_INBOUND_PORT = 5556
 
+# Topic frames used when server and clients run with topics=True.
+# SENT commands are published under their target component, replies under the
+# UUID of the client that sent the command. Topics end in "/" so a SUBSCRIBE
+# prefix for "motor_X" does not also match "motor_X2".
+_BROADCAST_REPLY_TOPIC = b"R/*/" # Replies whose originating client is unknown
+_OTHER_TOPIC = b"X/" # Anything that is not an Acquila payload
+_STATS_TOPIC = b"S/" # Periodic latency statistics published by the server
+
+# Reply type of the readiness probe a client sends to itself through the server
+PROBE_REPLY_TYPE = "PRB"
+# Reply type of the latency statistics a server publishes every stats_interval seconds
+STATS_REPLY_TYPE = "STS"
+
+# Outcome of one command of AcquilaClient.send_batch(); status is the reply type
+# that completed it, "no wait", "TIMEOUT" or "SKIPPED"
+BatchResult = collections.namedtuple("BatchResult", "index status reply")
+_BATCH_FAILED = ("ERR", "TIMEOUT", "SKIPPED") # Statuses that skip the commands depending on them
+
+def _endpoint(address, host):
+    """
+    ZMQ endpoint for a port number or a full URI. Ports mean TCP on host; URIs
+    ("tcp://...", "ipc:///tmp/acquila_out", "inproc://acquila_out") are used as is.
+    """
+    if isinstance(address, str) and "://" in address:
+        return address
+    return f"tcp://{host}:{address}"
+
+def _poll_fields(expected_feedback, interval_ms, timeout_ms, progress):
+    """
+    Extra payload keys asking a component to re-run a command until its result
+    equals expected_feedback (see send_command_until). Components that honour
+    them mark their RCV/ACK/ERR with "polled": True.
+    """
+    return {"poll_until": str(expected_feedback), "poll_interval_ms": interval_ms, "poll_timeout_ms": timeout_ms,
+            "poll_progress": progress}
+
+def _component_topic(name):
+    return f"C/{name}/".encode("utf-8")
+
+def _reply_topic(client_uuid):
+    return f"R/{client_uuid}/".encode("utf-8")
+
+def _on_component_topic(topic_frame):
+    # A topic-mode sender also receives its own SENT on its reply topic; only
+    # the copy on a component topic is work for a listener
+    return topic_frame.bytes.startswith(b"C/")
+
+def _is_subscription(frame):
+    # The XPUB side of a proxy passes subscribe/unsubscribe messages (b"\x01topic" /
+    # b"\x00topic") to the capture socket too; no codec starts a payload with these bytes
+    return bytes(memoryview(frame)[:1]) in (b"\x00", b"\x01")
+
+def _frame_origin(frame):
+    """Client UUID from a topic-mode origin frame; None if the frame is not one (e.g. a stray binary frame)."""
+    try:
+        return bytes(frame).decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+def _create_payload(component, comp_phys, command, arg1, arg2, reply, reply_type, uuid_val=None):
+    return {
+        "component": str(component),
+        "comp_phys": str(comp_phys),
+        "command": str(command),
+        "arg1": str(arg1),
+        "arg2": str(arg2),
+        "reply": str(reply),
+        "reply type": str(reply_type), 
+        "comp_type": "python_client",
+        "tick count": int(time.time() * 1000),
+        "UUID": uuid_val if uuid_val else str(uuid.uuid4())
+    }
+
 class AcquilaServer:
     """
     Emulates the Acquila Main Program (Server).
+
+    With topics=True every outbound message is published as a [topic, body]
+    multipart so subscribers can filter inside ZMQ; all clients of such a server
+    must then be created with topics=True as well.
+
+    Payloads in any codec (see acquila_zmq.codec) are decoded for bookkeeping and
+    relayed byte-for-byte, so clients using different codecs can share a server.
+    Frames are received and forwarded zero-copy; binary attachment frames (see
+    acquila_zmq.attach) are never looked at.
+
+    With fast_relay=True the server skips the RAW RECV traffic line and reads
+    only the reply type and UUID of RCV/FDB messages (unless an on_message
+    callback is installed). It also skips their store bookkeeping: RCV sets
+    the entry's status in place, without updating snapshot() or
+    with_status("RUNNING"), and FDB does not reset the stale timer. This saves
+    a few microseconds per progress message; for throughput beyond what one
+    Python thread can relay, use proxy=True.
+
+    With proxy=True forwarding runs inside libzmq (zmq.proxy_steerable between an
+    XSUB and an XPUB socket), so relay throughput no longer depends on Python.
+    Command tracking, statistics and the on_message callback consume the
+    proxy's capture socket on a separate thread; if they fall more than
+    TAP_HWM messages behind, the tap drops messages (and command_queue misses
+    their updates) rather than stalling the bus. Frames are forwarded unchanged,
+    so proxy mode cannot add topic frames and rejects topics=True.
+
+    Sockets are created on the process-wide zmq.Context.instance() unless a
+    context is passed in.
+
+    outbound_port and inbound_port are TCP ports bound on all interfaces, or
+    full ZMQ endpoints: "ipc:///tmp/acquila_out" for clients on the same host,
+    "inproc://acquila_out" for clients in the same process (these must use the
+    server's context, which the default shared context does automatically).
+
+    command_queue is a CommandStore: finished commands are dropped finished_ttl
+    seconds after their ACK/ERR, commands without traffic for stale_ttl seconds
+    are dropped as lost, and at most max_commands are kept. Monitors should read
+    it through snapshot() rather than under the lock themselves.
+
+    Queue (SENT->RCV), execution (RCV->ACK/ERR) and total latency are kept in
+    histograms per component and command; see latency_stats(). With
+    stats_interval set, the server also publishes them every stats_interval
+    seconds as a JSON STS message (topic "S/" in topic mode) carrying a
+    "stats" key.
     """
-    def __init__(self, outbound_port=DEFAULT_OUTBOUND_PORT, inbound_port=DEFAULT_INBOUND_PORT):
+    MAX_BATCH = 1000 # Messages handled per poll wake-up
+    EXPIRY_INTERVAL = 1.0 # Seconds between command_queue expiry passes
+    TAP_HWM = 100000 # Messages the proxy capture socket queues for the tap thread
+
+    def __init__(self, outbound_port=DEFAULT_OUTBOUND_PORT, inbound_port=DEFAULT_INBOUND_PORT, topics=False,
+                 fast_relay=False, context=None, max_commands=100000, finished_ttl=10.0, stale_ttl=3600.0,
+                 stats_interval=None, proxy=False):
+        if proxy and topics:
+            raise ValueError("proxy=True forwards frames unchanged and cannot publish topics; use topics=False")
         self.outbound_port = outbound_port
         self.inbound_port = inbound_port
-        self.context = zmq.Context()
+        self.outbound_endpoint = _endpoint(outbound_port, "*")
+        self.inbound_endpoint = _endpoint(inbound_port, "*")
+        self.topics = topics
+        self.fast_relay = fast_relay
+        self.context = context or zmq.Context.instance()
         self.socket_out = None
         self.socket_in = None
         self.running = False
-        self.command_queue = {} # Tracks active commands by UUID
+        self.command_queue = CommandStore(max_commands, finished_ttl, stale_ttl) # Tracks commands by UUID
         self.lock = threading.Lock() # Protects command_queue
+        self.latency = LatencyStats(lock=self.lock) # Recorded from _track, under the lock
+        self.stats_interval = stats_interval
         self.on_message_callback = None # Optional callback(msg_json)
+        self.proxy = proxy
+        self.socket_stats = None # Proxy mode: publishes STS messages into the proxy frontend
+        self._proxy_name = f"inproc://acquila-proxy-{id(self)}"
+        self._proxy_control = None
 
     def _setup_sockets(self):
         self.socket_out = self.context.socket(zmq.PUB)
-        self.socket_out.bind(f"tcp://*:{self.outbound_port}")
+        self.socket_out.bind(self.outbound_endpoint)
         self.socket_in = self.context.socket(zmq.SUB)
-        self.socket_in.bind(f"tcp://*:{self.inbound_port}")
+        self.socket_in.bind(self.inbound_endpoint)
         self.socket_in.setsockopt_string(zmq.SUBSCRIBE, "") 
-        print(f"Acquila Server sockets bound on {self.inbound_port} (in) / {self.outbound_port} (out)")
+        logger.info("Acquila Server sockets bound on %s (in) / %s (out)", self.inbound_endpoint, self.outbound_endpoint)
 
     def start(self, on_message=None):
         self.on_message_callback = on_message
-        self._setup_sockets()
         self.running = True
-        
-        poller = zmq.Poller()
-        poller.register(self.socket_in, zmq.POLLIN)
-        
+        if self.proxy:
+            self._start_proxy()
+            return
+        self._setup_sockets()
         try:
-            while self.running:
-                socks = dict(poller.poll(timeout=100)) # Poll with 100ms timeout
-                if self.socket_in in socks and socks[self.socket_in] == zmq.POLLIN:
-                    try:
-                        msg = self.socket_in.recv_string()
-                        print(f"[SERVER] RAW RECV: {msg}") # Diagnostic log
-                        
-                        # --- Command Queue Logic ---
-                        try:
-                            data = json.loads(msg)
-                            r_type = data.get("reply type")
-                            uuid_val = data.get("UUID")
-
-                            if uuid_val:
-                                with self.lock:
-                                    if r_type == "SENT":
-                                        data["status"] = "PENDING"
-                                        self.command_queue[uuid_val] = data
-                                        print(f"[SERVER] Queueing: {data.get('command')} for {data.get('component')}")
-                                    
-                                    elif r_type == "RCV":
-                                        if uuid_val in self.command_queue:
-                                            self.command_queue[uuid_val]["status"] = "RUNNING"
-                                            print(f"[SERVER] Running: {uuid_val}")
-                                            
-                                    elif r_type in ["ACK", "ERR"]:
-                                        if uuid_val in self.command_queue:
-                                            print(f"[SERVER] Finished: {uuid_val} ({r_type})")
-                                            self.command_queue[uuid_val]["status"] = "FINISHED"
-                                            self.command_queue[uuid_val]["reply type"] = r_type
-                                            self.command_queue[uuid_val]["reply"] = data.get("reply", "")
-                                            self.command_queue[uuid_val]["finish_time"] = time.time()
-                            
-                            if self.on_message_callback:
-                                self.on_message_callback(data)
-                                
-                        except json.JSONDecodeError:
-                            print(f"[SERVER] Raw string received: {msg}")
-                            if self.on_message_callback:
-                                self.on_message_callback({"raw": msg})
-                        # ---------------------------
-
-                        # Simply relay the message to all subscribers
-                        self.socket_out.send_string(msg)
-                    except zmq.ZMQError as e:
-                        print(f"ZMQ Receive error: {e}")
-                        break
+            self._serve(self.socket_in)
         except Exception as e:
-            print(f"Server execution error: {e}")
+            logger.exception("Server execution error: %s", e)
         finally:
             self.stop()
 
+    def _serve(self, socket):
+        """Handles the messages arriving on socket, plus expiry and stats, until stop() is called."""
+        poller = zmq.Poller()
+        poller.register(socket, zmq.POLLIN)
+        next_expiry = time.monotonic() + self.EXPIRY_INTERVAL
+        next_stats = time.monotonic() + (self.stats_interval or 0)
+
+        while self.running:
+            socks = dict(poller.poll(timeout=100)) # Poll with 100ms timeout
+            if time.monotonic() >= next_expiry:
+                with self.lock:
+                    self.command_queue.expire()
+                next_expiry = time.monotonic() + self.EXPIRY_INTERVAL
+            if self.stats_interval and time.monotonic() >= next_stats:
+                self._publish_stats()
+                next_stats = time.monotonic() + self.stats_interval
+            if socks.get(socket) == zmq.POLLIN:
+                try:
+                    # Drain everything already queued before polling again
+                    for _ in range(self.MAX_BATCH):
+                        if not self.running:
+                            break
+                        # Topic-mode clients prepend a frame holding their own UUID
+                        # zmq.Frames: only the body is ever copied out (by the handler), attachments never
+                        frames = socket.recv_multipart(flags=zmq.NOBLOCK, copy=False)
+                        if self.proxy and len(frames) == 1 and _is_subscription(frames[0]):
+                            continue
+                        try:
+                            if self.fast_relay:
+                                self._handle_fast(frames)
+                            else:
+                                self._handle(frames)
+                        except Exception as e: # One bad message must not stop the bus
+                            logger.exception("Dropped a message the server could not handle: %s", e)
+                except zmq.Again:
+                    pass
+                except zmq.ZMQError as e:
+                    logger.error("ZMQ Receive error: %s", e)
+                    break
+
+    def _start_proxy(self):
+        frontend = self.context.socket(zmq.XSUB)
+        frontend.bind(self.inbound_endpoint)
+        frontend.bind(self._proxy_name + "-stats")
+        frontend.send(b"\x01") # Subscribe to everything, like the SUB socket of the Python relay
+        backend = self.context.socket(zmq.XPUB)
+        backend.bind(self.outbound_endpoint)
+        capture = self.context.socket(zmq.PUB) # Drops instead of blocking the proxy when the tap lags
+        capture.setsockopt(zmq.SNDHWM, self.TAP_HWM)
+        capture.bind(self._proxy_name + "-tap")
+        control = self.context.socket(zmq.REP)
+        control.bind(self._proxy_name + "-control")
+        logger.info("Acquila Server proxy bound on %s (in) / %s (out)", self.inbound_endpoint, self.outbound_endpoint)
+
+        ready = threading.Event()
+        tap = threading.Thread(target=self._run_tap, args=(ready,), daemon=True)
+        tap.start()
+        ready.wait()
+        self._proxy_control = self._proxy_name + "-control"
+        try:
+            if self.running: # Unless stop() came first
+                zmq.proxy_steerable(frontend, backend, capture, control) # Returns on TERMINATE
+        except zmq.ZMQError as e:
+            logger.error("Proxy error: %s", e)
+        except Exception as e:
+            logger.exception("Server execution error: %s", e)
+        finally:
+            self._proxy_control = None
+            self.running = False
+            tap.join()
+            for socket in (frontend, backend, capture, control):
+                socket.close(linger=0)
+            logger.info("Acquila Server stopped.")
+
+    def _run_tap(self, ready):
+        socket = self.context.socket(zmq.SUB)
+        socket.setsockopt(zmq.RCVHWM, self.TAP_HWM)
+        socket.connect(self._proxy_name + "-tap")
+        socket.setsockopt(zmq.SUBSCRIBE, b"")
+        if self.stats_interval:
+            self.socket_stats = self.context.socket(zmq.PUB)
+            self.socket_stats.connect(self._proxy_name + "-stats")
+        ready.set()
+        try:
+            self._serve(socket)
+        except Exception as e:
+            logger.exception("Server tap error: %s", e)
+        finally:
+            socket.close(linger=0)
+            if self.socket_stats:
+                self.socket_stats.close(linger=0)
+                self.socket_stats = None
+
+    def snapshot(self, since_version=0):
+        """
+        Copies of the commands changed since since_version plus the UUIDs removed
+        since then, as a CommandSnapshot. The lock is held only while the changes
+        are copied, so polling with the last returned version is cheap:
+
+            snap = server.snapshot()
+            ...
+            snap = server.snapshot(snap.version)
+        """
+        with self.lock:
+            return self.command_queue.snapshot(since_version)
+
+    def latency_stats(self, component=None):
+        """
+        Latency summary per "component/command": {"queue": {...}, "execution":
+        {...}, "total": {...}, "errors": n}, each with count, mean, min,
+        p50/p90/p99 and max in milliseconds. Safe to call from any thread.
+        """
+        return self.latency.summary(component)
+
+    def _publish_stats(self):
+        payload = _create_payload("acquila_server", "", "stats", "", "", "", STATS_REPLY_TYPE)
+        payload["stats"] = self.latency.summary()
+        body = json.dumps(payload).encode("utf-8")
+        if self.proxy:
+            self.socket_stats.send(body) # Forwarded by the proxy like any client message
+        else:
+            self._relay(body, STATS_REPLY_TYPE, payload, None)
+
+    def _handle(self, frames):
+        body = frames[-1]
+        origin = _frame_origin(frames[0]) if self.topics and len(frames) > 1 else None
+        attachments = frames[1 if self.topics else 0:-1]
+        raw = body.bytes
+        try:
+            data = decode_payload(raw)
+        except CodecError:
+            msg = raw.decode("utf-8", errors="replace")
+            traffic_log.warning("[SERVER] Raw string received: %s", msg)
+            if self.on_message_callback:
+                self.on_message_callback({"raw": msg})
+            self._relay(body, None, None, None, attachments)
+            return
+
+        traffic_log.debug("[SERVER] RAW RECV: %s", data)
+        r_type = data.get("reply type")
+        if r_type == PROBE_REPLY_TYPE:
+            self._relay(body, r_type, data, origin) # Echo straight back to the probing client
+            return
+        reply_origin = self._track(r_type, data.get("UUID"), data, origin)
+        if self.on_message_callback:
+            self.on_message_callback(data)
+        self._relay(body, r_type, data, reply_origin, attachments)
+
+    def _handle_fast(self, frames):
+        body = frames[-1]
+        origin = _frame_origin(frames[0]) if self.topics and len(frames) > 1 else None
+        attachments = frames[1 if self.topics else 0:-1]
+        raw = body.bytes
+        # RCV/FDB only need their reply type and UUID; SENT (queued as a whole), ACK/ERR
+        # (reply stored) and anything else are decoded once, in full
+        progress = None if self.on_message_callback else peek_progress(raw)
+        if progress:
+            r_type, uuid_val = progress
+            self._relay(body, r_type, None, self._track_progress(r_type, uuid_val), attachments)
+            return
+        try:
+            data = decode_payload(raw)
+        except CodecError:
+            if self.on_message_callback:
+                self.on_message_callback({"raw": raw.decode("utf-8", errors="replace")})
+            self._relay(body, None, None, None, attachments)
+            return
+        r_type, uuid_val = data.get("reply type"), data.get("UUID")
+        if r_type == PROBE_REPLY_TYPE:
+            self._relay(body, r_type, data, origin) # Echo straight back to the probing client
+            return
+
+        reply_origin = self._track(r_type, uuid_val, data, origin)
+        if self.on_message_callback:
+            self.on_message_callback(data)
+        self._relay(body, r_type, data, reply_origin, attachments)
+
+    def _track_progress(self, r_type, uuid_val):
+        """
+        fast_relay's bookkeeping for RCV/FDB: RCV flips the entry to RUNNING in
+        place, FDB changes nothing. Returns the origin to route the reply to.
+        """
+        with self.lock:
+            entry = self.command_queue.get(uuid_val)
+            if entry is None:
+                return None
+            if r_type == "RCV" and entry.get("status") == "PENDING":
+                entry["status"] = "RUNNING"
+                entry["rcv_time"] = time.time()
+            return entry.get("origin")
+
+    def _track(self, r_type, uuid_val, data, origin):
+        """
+        Command Queue Logic: updates command_queue for one message and returns the
+        client UUID a reply should be routed to (topic mode), if known.
+        """
+        if not uuid_val:
+            return None
+        with self.lock:
+            if r_type == "SENT":
+                data["status"] = "PENDING"
+                data["sent_time"] = time.time()
+                if origin:
+                    data["origin"] = origin
+                self.command_queue[uuid_val] = data
+                traffic_log.debug("[SERVER] Queueing: %s for %s", data.get("command"), data.get("component"))
+                return origin # Echoed to the sender too, for wait_for="SENT"
+
+            entry = self.command_queue.get(uuid_val)
+            if entry is None:
+                return None
+
+            if r_type == "RCV":
+                if entry.get("status") == "PENDING":
+                    self.command_queue.set_status(uuid_val, "RUNNING", rcv_time=time.time())
+                traffic_log.debug("[SERVER] Running: %s", uuid_val)
+
+            elif r_type == "FDB":
+                self.command_queue.touch(uuid_val)
+                    
+            elif r_type in ["ACK", "ERR"]:
+                traffic_log.debug("[SERVER] Finished: %s (%s)", uuid_val, r_type)
+                now = time.time()
+                if entry.get("status") != "FINISHED":
+                    # Latencies are recorded once per command, when it finishes
+                    self.latency.record_command(entry.get("component"), entry.get("command"),
+                                                entry.get("sent_time"), entry.get("rcv_time"), now, r_type == "ERR")
+                self.command_queue.set_status(uuid_val, "FINISHED", **{
+                    "reply type": r_type, "reply": data.get("reply", ""), "finish_time": now})
+
+            return entry.get("origin")
+
+    def _relay(self, body, r_type, data, reply_origin, attachments=()):
+        if self.proxy:
+            return # libzmq has already forwarded it
+        if not self.topics:
+            # Simply relay the message to all subscribers
+            if attachments:
+                self.socket_out.send_multipart([*attachments, body], copy=False)
+            else:
+                self.socket_out.send(body, copy=False)
+            return
+
+        for topic in self._topics_for(r_type, data, reply_origin):
+            self.socket_out.send_multipart([topic, *attachments, body], copy=False)
+
+    def _topics_for(self, r_type, data, reply_origin):
+        if data is None and r_type is None:
+            return [_OTHER_TOPIC]
+        if r_type == PROBE_REPLY_TYPE and data.get("component"):
+            return [_component_topic(data["component"])] # Proves that component's subscription is live
+        if r_type == PROBE_REPLY_TYPE and not reply_origin:
+            return [_OTHER_TOPIC]
+        if r_type == STATS_REPLY_TYPE:
+            return [_STATS_TOPIC]
+        if r_type == "SENT":
+            # A command is addressed by abstract and/or physical name; publish under each
+            names = {data.get("component"), data.get("comp_phys")} - {None, ""}
+            topics = [_component_topic(name) for name in names] or [_OTHER_TOPIC]
+            if reply_origin:
+                topics.append(_reply_topic(reply_origin))
+            return topics
+        if reply_origin:
+            return [_reply_topic(reply_origin)]
+        return [_BROADCAST_REPLY_TOPIC]
+
     def stop(self):
         self.running = False
+        if self._proxy_control:
+            control = self.context.socket(zmq.REQ)
+            control.connect(self._proxy_control)
+            control.send(b"TERMINATE")
+            control.poll(1000) # The proxy answers once it has stopped forwarding
+            control.close(linger=0)
+            return
         if self.socket_out:
             try:
                 self.socket_out.close(linger=0)
@@ -115,40 +492,350 @@ class AcquilaServer:
                 self.socket_in.close(linger=0)
             except: pass
             self.socket_in = None
-        print("Acquila Server stopped.")
+        logger.info("Acquila Server stopped.")
+
+class _CommandWaiter:
+    """
+    Collects the messages the receiver thread routes to one command UUID.
+    """
+    def __init__(self, uuid_val):
+        self.uuid = uuid_val
+        self.messages = collections.deque()
+        self.cond = threading.Condition()
+
+    def put(self, data):
+        with self.cond:
+            self.messages.append(data)
+            self.cond.notify_all()
+
+    def get(self, timeout_s):
+        """Returns the next routed message, or None once timeout_s has elapsed."""
+        end_time = time.monotonic() + timeout_s
+        with self.cond:
+            while not self.messages:
+                remaining = end_time - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self.cond.wait(remaining)
+            return self.messages.popleft()
+
+class _FeedbackWaiter(_CommandWaiter):
+    """
+    Waiter for iter_feedback. Keeps at most max_buffer unread FDBs, dropping the
+    oldest when the component reports faster than the consumer reads, so the
+    newest progress is always kept. The final ACK/ERR is held apart and never
+    dropped; other reply types are ignored.
+    """
+    def __init__(self, uuid_val, max_buffer=None):
+        super().__init__(uuid_val)
+        self.messages = collections.deque(maxlen=max_buffer)
+        self.final = None
+        self.dropped = 0
+
+    def put(self, data):
+        r_type = data.get("reply type")
+        with self.cond:
+            if r_type == "FDB":
+                if len(self.messages) == self.messages.maxlen:
+                    self.dropped += 1
+                self.messages.append(data)
+            elif r_type in ("ACK", "ERR"):
+                self.final = data
+            else:
+                return
+            self.cond.notify_all()
+
+    def get(self, timeout_s=None):
+        """Oldest kept FDB, else the final reply; None once timeout_s has elapsed (None waits forever)."""
+        end_time = None if timeout_s is None else time.monotonic() + timeout_s
+        with self.cond:
+            while not self.messages and self.final is None:
+                remaining = None if end_time is None else end_time - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.cond.wait(remaining)
+            if self.messages:
+                return self.messages.popleft()
+            final, self.final = self.final, None
+            return final
+
+def _poll_until(callback_function, client, data):
+    """
+    Re-runs callback_function every poll_interval_ms until its result equals
+    poll_until, sending the intermediate result as FDB whenever it changes if
+    poll_progress is set. Raises TimeoutError after poll_timeout_ms.
+    """
+    expected = str(data["poll_until"])
+    interval_s = float(data.get("poll_interval_ms", 500)) / 1000.0
+    end_time = time.monotonic() + float(data.get("poll_timeout_ms", 30000)) / 1000.0
+    last = None
+    while True:
+        result = str(callback_function(client, data))
+        if result == expected:
+            return result
+        if result != last and data.get("poll_progress") and client is not None:
+            client.send_feedback(data, result)
+        last = result
+        if time.monotonic() + interval_s > end_time:
+            raise TimeoutError(f"Still '{result}' after {data.get('poll_timeout_ms')} ms, expected '{expected}'")
+        time.sleep(interval_s)
+
+def _execute(callback_function, client, data):
+    """Runs a command's callback once, or until its poll_until condition holds."""
+    if "poll_until" in data:
+        return _poll_until(callback_function, client, data)
+    return callback_function(client, data)
+
+def _call_in_process(callback_function, data):
+    # Runs in a worker process, which has no client to send feedback through
+    return _execute(callback_function, None, data)
+
+class _CommandDispatcher:
+    """
+    Runs listen_and_process callbacks on a thread or process pool. Commands with
+    the same ordering key run one at a time in arrival order; the final ACK/ERR
+    is sent from the worker that completes the job, through the client's
+    send_lock like every other send.
+    """
+    def __init__(self, client, callback_function, max_workers, use_processes=False, ordering_key=None):
+        self.client = client
+        self.callback_function = callback_function
+        self.use_processes = use_processes
+        self.ordering_key = ordering_key
+        if use_processes:
+            # Forking would copy the client's sockets and the receiver thread's locks into each worker
+            self.executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.backlogs = {} # ordering key -> deque of commands queued behind the running one
+        self.lock = threading.Lock()
+        self.running = True
+
+    def submit(self, data, reply_payload):
+        try:
+            key = self.ordering_key(data) if self.ordering_key else None
+            hash(key) # An unhashable key would fail below, inside the lock
+        except Exception as e:
+            self._reply(reply_payload, "ERR", f"ordering_key failed: {e}")
+            return
+        if key is not None:
+            with self.lock:
+                backlog = self.backlogs.get(key)
+                if backlog is not None:
+                    backlog.append((data, reply_payload))
+                    return
+                self.backlogs[key] = collections.deque()
+        self._start(key, data, reply_payload)
+
+    def _start(self, key, data, reply_payload):
+        if self.use_processes:
+            if "attachments" in data: # Received frames cannot be pickled
+                data = dict(data, attachments=[bytes(a) for a in data["attachments"]])
+            future = self.executor.submit(_call_in_process, self.callback_function, data)
+        else:
+            future = self.executor.submit(_execute, self.callback_function, self.client, data)
+        future.add_done_callback(lambda f: self._finish(f, key, reply_payload))
+
+    def _finish(self, future, key, reply_payload):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is None:
+            self._reply(reply_payload, "ACK", str(future.result()))
+        else:
+            self._reply(reply_payload, "ERR", str(error))
+
+        if key is None:
+            return
+        with self.lock:
+            backlog = self.backlogs[key]
+            if not backlog or not self.running:
+                del self.backlogs[key]
+                return
+            next_data, next_reply = backlog.popleft()
+        try:
+            self._start(key, next_data, next_reply)
+        except RuntimeError: # Executor shut down in the meantime
+            pass
+
+    def _reply(self, reply_payload, r_type, reply):
+        reply_payload["reply type"] = r_type
+        reply_payload["reply"] = reply
+        try:
+            self.client._send(reply_payload)
+        except zmq.ZMQError as e:
+            logger.error("[COMPONENT] Could not send %s: %s", r_type, e)
+
+    def shutdown(self, wait=True):
+        """Stops starting queued commands; wait=True lets the running ones finish."""
+        with self.lock:
+            self.running = False
+        self.executor.shutdown(wait=wait)
 
 class AcquilaClient:
-    def __init__(self, server_ip="127.0.0.1", outbound_port=DEFAULT_OUTBOUND_PORT, inbound_port=DEFAULT_INBOUND_PORT):
-        self.context = zmq.Context()
+    """
+    Sends commands and/or acts as a component. Use topics=True with a topic-mode
+    AcquilaServer so the client only receives its own replies and the commands
+    for the components it listens as.
+
+    codec selects the encoding of outgoing messages ("json", "msgpack", "struct");
+    incoming messages are decoded whatever codec their sender used.
+
+    All clients share the process-wide zmq.Context.instance() (one set of IO
+    threads) unless a context is passed in; see ClientPool for reusing clients.
+
+    outbound_port and inbound_port are the server's TCP ports on server_ip, or
+    the full endpoints the server was created with ("ipc://..." or
+    "inproc://..."), in which case server_ip is not used.
+
+    The constructor returns as soon as a probe sent to the server has come back
+    on the receive socket, i.e. both directions are live; handshake_timeout_ms
+    bounds the wait (0 skips it). self.ready tells whether the echo arrived.
+
+    send_command, send_feedback and send_batch steps take attachments: a list
+    of bytes-like objects or SharedAttachment blocks sent as extra zero-copy
+    frames. Received ones are under data["attachments"]; see acquila_zmq.attach.
+    """
+    POLL_GRACE_MS = 1000 # Extra wait in send_command_until for the component's own timeout ERR
+
+    def __init__(self, server_ip="127.0.0.1", outbound_port=DEFAULT_OUTBOUND_PORT, inbound_port=DEFAULT_INBOUND_PORT,
+                 topics=False, codec="json", context=None, handshake_timeout_ms=1000):
+        self.context = context or zmq.Context.instance()
+        self.server_ip = server_ip
+        self.outbound_port = outbound_port
+        self.inbound_port = inbound_port
+        self.outbound_endpoint = _endpoint(outbound_port, server_ip)
+        self.inbound_endpoint = _endpoint(inbound_port, server_ip)
         self.uuid = str(uuid.uuid4())
+        self.topics = topics
+        self.codec = get_codec(codec)
         
         # Socket to SEND commands (connects to Server Inbound)
         self.socket_send = self.context.socket(zmq.PUB)
-        self.socket_send.connect(f"tcp://{server_ip}:{inbound_port}")
+        self.socket_send.connect(self.inbound_endpoint)
+        self.send_lock = threading.Lock() # ZMQ sockets are not thread-safe
         
-        # Socket to RECEIVE (connects to Server Outbound)
+        # Socket to RECEIVE (connects to Server Outbound), owned by the receiver thread
         self.socket_recv = self.context.socket(zmq.SUB)
-        self.socket_recv.connect(f"tcp://{server_ip}:{outbound_port}")
-        self.socket_recv.setsockopt_string(zmq.SUBSCRIBE, "") 
+        self.socket_recv.connect(self.outbound_endpoint)
+        if topics:
+            self.socket_recv.setsockopt(zmq.SUBSCRIBE, _reply_topic(self.uuid))
+            self.socket_recv.setsockopt(zmq.SUBSCRIBE, _BROADCAST_REPLY_TOPIC)
+        else:
+            self.socket_recv.setsockopt_string(zmq.SUBSCRIBE, "") 
+        self.pending_subscriptions = queue.Queue() # Applied by the receiver thread
+        # Wakes the receiver thread out of its poll as soon as a subscription is queued
+        wake_endpoint = f"inproc://acquila-client-wake-{self.uuid}"
+        self.wake_recv = self.context.socket(zmq.PAIR)
+        self.wake_recv.bind(wake_endpoint)
+        self.wake_send = self.context.socket(zmq.PAIR)
+        self.wake_send.connect(wake_endpoint)
+        self.wake_lock = threading.Lock()
+        self.handshake_timeout_ms = handshake_timeout_ms
+
+        self.waiters = {} # Pending commands by UUID -> _CommandWaiter
+        self.waiters_lock = threading.Lock()
+        self.inbox = None # queue.Queue of SENT messages, created by listen_and_process
+        self.running = True
+        self.receiver_thread = threading.Thread(target=self._receive_loop, name="AcquilaClientReceiver", daemon=True)
+        self.receiver_thread.start()
         
-        print(f"[CLIENT] Connected to {server_ip}: {inbound_port}(in)/{outbound_port}(out)")
-        time.sleep(1.0) # Increased wait for ZMQ PUB/SUB handshake
+        logger.info("[CLIENT] Connected to %s (in) / %s (out)", self.inbound_endpoint, self.outbound_endpoint)
+        self.ready = self.wait_ready(handshake_timeout_ms) if handshake_timeout_ms else False
+
+    def wait_ready(self, timeout_ms=1000, interval_ms=10, component=""):
+        """
+        Repeats a probe through the server until it is echoed back, which proves
+        the PUB/SUB paths in both directions are established (ZMQ silently drops
+        messages published before a subscription has propagated). With a
+        component, a topic-mode server echoes the probe on that component's
+        topic, proving this client's subscription to it is live.
+        """
+        probe_uuid = str(uuid.uuid4())
+        waiter = _CommandWaiter(probe_uuid)
+        with self.waiters_lock:
+            self.waiters[probe_uuid] = waiter
+        try:
+            end_time = time.monotonic() + timeout_ms / 1000.0
+            while time.monotonic() < end_time:
+                self._send(_create_payload(component, "", "", "", "", "", PROBE_REPLY_TYPE, probe_uuid))
+                if waiter.get(min(interval_ms / 1000.0, max(0.0, end_time - time.monotonic()))) is not None:
+                    return True
+        finally:
+            with self.waiters_lock:
+                self.waiters.pop(probe_uuid, None)
+        logger.warning("[CLIENT] No handshake echo from the server within %s ms", timeout_ms)
+        return False
+
+    def _receive_loop(self):
+        """
+        Parses every inbound message once and routes it by UUID to the waiting
+        send_command calls; SENT messages also go to the listen_and_process inbox.
+        """
+        poller = zmq.Poller()
+        poller.register(self.socket_recv, zmq.POLLIN)
+        poller.register(self.wake_recv, zmq.POLLIN)
+        
+        while self.running:
+            try:
+                while not self.pending_subscriptions.empty():
+                    self.socket_recv.setsockopt(zmq.SUBSCRIBE, self.pending_subscriptions.get())
+                socks = dict(poller.poll(timeout=100))
+                if self.wake_recv in socks:
+                    self.wake_recv.recv()
+                    continue
+                if self.socket_recv not in socks:
+                    continue
+                # The body is the last frame, after the topic and any attachments
+                frames = self.socket_recv.recv_multipart(copy=False)
+            except zmq.ZMQError as e:
+                if self.running:
+                    logger.error("[CLIENT] Receive error: %s", e)
+                break
+            
+            try:
+                data = decode_payload(frames[-1].buffer)
+            except CodecError:
+                traffic_log.warning("[CLIENT] Raw string received: %s", frames[-1].bytes.decode("utf-8", errors="replace"))
+                continue
+            # One bad message must not end the thread every send_command depends on
+            try:
+                uuid_val = data.get("UUID")
+                if not isinstance(uuid_val, str):
+                    traffic_log.warning("[CLIENT] Ignoring message without a string UUID: %s", data)
+                    continue
+                attachments = frames[1 if self.topics else 0:-1]
+                if attachments:
+                    data["attachments"] = [frame.buffer for frame in attachments]
+
+                with self.waiters_lock:
+                    waiter = self.waiters.get(uuid_val)
+                if waiter:
+                    waiter.put(data)
+
+                inbox = self.inbox
+                if (inbox is not None and data.get("reply type") == "SENT"
+                        and (not self.topics or _on_component_topic(frames[0]))):
+                    inbox.put(data)
+            except Exception as e:
+                logger.exception("[CLIENT] Dropped a message that could not be routed: %s", e)
+
+    def _send(self, payload, attachments=None):
+        body = self.codec.encode(payload)
+        with self.send_lock:
+            frames = [*map(attachment_frame, attachments or ()), body]
+            if self.topics:
+                # Lets a topic-mode server route replies back to this client only
+                frames.insert(0, self.uuid.encode("utf-8"))
+            if len(frames) > 1:
+                self.socket_send.send_multipart(frames, copy=False)
+            else:
+                self.socket_send.send(body)
 
     def _create_payload(self, component, comp_phys, command, arg1, arg2, reply, reply_type, uuid_val=None):
-        return {
-            "component": str(component),
-            "comp_phys": str(comp_phys),
-            "command": str(command),
-            "arg1": str(arg1),
-            "arg2": str(arg2),
-            "reply": str(reply),
-            "reply type": str(reply_type), 
-            "comp_type": "python_client",
-            "tick count": int(time.time() * 1000),
-            "UUID": uuid_val if uuid_val else str(uuid.uuid4())
-        }
-
-    def send_feedback(self, original_command_data, feedback_msg):
+        return _create_payload(component, comp_phys, command, arg1, arg2, reply, reply_type, uuid_val)
+
+    def send_feedback(self, original_command_data, feedback_msg, attachments=None):
         payload = self._create_payload(
             component=original_command_data.get("component"),
             comp_phys=original_command_data.get("comp_phys"),
@@ -159,52 +846,238 @@ class AcquilaClient:
             reply_type="FDB",
             uuid_val=original_command_data.get("UUID")
         )
-        self.socket_send.send_string(json.dumps(payload))
+        self._send(payload, attachments)
 
-    def send_command(self, component, command, arg1="", arg2="", wait_for="ACK", timeout_ms=10000):
+    def send_command(self, component, command, arg1="", arg2="", wait_for="ACK", timeout_ms=10000, attachments=None):
         """
         Standard command sending with improved logging and slightly longer default timeout.
+        Safe to call from several threads at once: replies are routed by UUID.
         """
         my_uuid = str(uuid.uuid4())
         payload = self._create_payload(component, "", command, arg1, arg2, "", "SENT", my_uuid)
         
-        print(f"[CLIENT] Sending: {command} to {component} (UUID: {my_uuid})")
-        self.socket_send.send_string(json.dumps(payload))
+        if wait_for == "no wait":
+            traffic_log.debug("[CLIENT] Sending: %s to %s (UUID: %s)", command, component, my_uuid)
+            self._send(payload, attachments)
+            return None
 
-        if wait_for == "no wait": return None
+        # Register before sending so no reply can arrive ahead of its waiter
+        waiter = _CommandWaiter(my_uuid)
+        with self.waiters_lock:
+            self.waiters[my_uuid] = waiter
+        
+        try:
+            traffic_log.debug("[CLIENT] Sending: %s to %s (UUID: %s)", command, component, my_uuid)
+            self._send(payload, attachments)
 
-        start_time = time.time() * 1000
-        while (time.time() * 1000 - start_time) < timeout_ms:
-            try:
-                rec_string = self.socket_recv.recv_string(flags=zmq.NOBLOCK)
-                rec_json = json.loads(rec_string)
+            # Block on the waiter until the receiver thread routes a reply or the deadline passes
+            end_time = time.monotonic() + timeout_ms / 1000.0
+            while True:
+                rec_json = waiter.get(end_time - time.monotonic())
+                if rec_json is None:
+                    break
 
-                if rec_json.get("UUID") == my_uuid:
-                    r_type = rec_json.get("reply type")
-                    print(f"   <-- Received response: {r_type} ('{rec_json.get('reply')}')")
-                    
-                    if r_type == "FDB":
-                        if wait_for == "FDB": return rec_json
-                    
-                    elif r_type == wait_for:
-                        return rec_json
-                    
-                    elif wait_for == "ACK" and r_type == "ACK":
-                        return rec_json
-                        
-            except zmq.Again:
-                time.sleep(0.01)
-            except Exception as e:
-                print(f"[CLIENT] Receive error: {e}")
+                r_type = rec_json.get("reply type")
+                if r_type == "SENT":
+                    if wait_for == "SENT": return rec_json
+                    continue # Our own command echoed back by the server
+
+                traffic_log.debug("   <-- Received response: %s ('%s')", r_type, rec_json.get("reply"))
+                if r_type == wait_for:
+                    return rec_json
+        finally:
+            with self.waiters_lock:
+                self.waiters.pop(my_uuid, None)
         
-        print(f"[CLIENT] Timeout waiting for {wait_for} (UUID: {my_uuid})")
+        logger.warning("[CLIENT] Timeout waiting for %s (UUID: %s)", wait_for, my_uuid)
         return None
 
-    def send_command_until(self, component, command, expected_feedback, interval_ms=500, timeout_ms=30000):
-        print(f"[CLIENT] REPEAT UNTIL '{expected_feedback}'...")
-        start_time = time.time() * 1000
-        
-        while (time.time() * 1000 - start_time) < timeout_ms:
+    def send_batch(self, commands, max_in_flight=16, timeout_ms=10000):
+        """
+        Pipelines a list of commands and yields a BatchResult(index, status,
+        reply) for each one as soon as it completes, which is not necessarily in
+        list order. At most max_in_flight commands are outstanding at a time;
+        max_in_flight=1 sends them one by one like consecutive send_command calls.
+
+        Each command is a dict with "component" and "command", optionally
+        "arg1", "arg2", "wait_for" (as for send_command, default "ACK") and
+        "attachments", and:
+
+            "after": [indices]   earlier commands that must complete first
+            "barrier": True      waits for every earlier command, and every
+                                 later command waits for this one
+
+        status is the reply type that completed the command; a command waiting
+        for RCV or FDB also completes on ACK/ERR. "no wait" commands complete
+        when sent, "TIMEOUT" means nothing arrived within timeout_ms of sending,
+        and commands depending on one that ended in ERR, TIMEOUT or SKIPPED are
+        not sent and come back as "SKIPPED". Closing the generator early stops
+        sending the rest. Raises ValueError if max_in_flight is below 1.
+        """
+        if max_in_flight < 1:
+            raise ValueError(f"max_in_flight must be at least 1, got {max_in_flight}")
+        steps = list(commands)
+        deps = []
+        last_barrier = None
+        for i, step in enumerate(steps):
+            after = set(step.get("after", ()))
+            if any(not 0 <= j < i for j in after):
+                raise ValueError(f"Command {i} can only depend on earlier commands, got {sorted(after)}")
+            if step.get("barrier"):
+                after.update(range(last_barrier or 0, i)) # Earlier ones are covered by the previous barrier
+                last_barrier = i
+            elif last_barrier is not None:
+                after.add(last_barrier)
+            deps.append(after)
+
+        status = [None] * len(steps)
+        unsent = list(range(len(steps)))
+        in_flight = {} # UUID -> (index, wait_for, deadline)
+        # One waiter registered under every outstanding UUID collects all replies of the batch
+        waiter = _CommandWaiter(None)
+        try:
+            while unsent or in_flight:
+                blocked = []
+                for position, i in enumerate(unsent):
+                    if len(in_flight) >= max_in_flight:
+                        blocked.extend(unsent[position:])
+                        break
+                    dep_status = [status[j] for j in deps[i]]
+                    if None in dep_status:
+                        blocked.append(i)
+                        continue
+                    if any(s in _BATCH_FAILED for s in dep_status):
+                        status[i] = "SKIPPED"
+                        yield BatchResult(i, "SKIPPED", None)
+                        continue
+
+                    step = steps[i]
+                    wait_for = step.get("wait_for") or "ACK"
+                    my_uuid = str(uuid.uuid4())
+                    payload = self._create_payload(step["component"], "", step["command"], step.get("arg1", ""),
+                                                   step.get("arg2", ""), "", "SENT", my_uuid)
+                    traffic_log.debug("[CLIENT] Sending: %s to %s (UUID: %s)", step["command"], step["component"], my_uuid)
+                    if wait_for == "no wait":
+                        self._send(payload, step.get("attachments"))
+                        status[i] = "no wait"
+                        yield BatchResult(i, "no wait", None)
+                        continue
+                    with self.waiters_lock:
+                        self.waiters[my_uuid] = waiter
+                    in_flight[my_uuid] = (i, wait_for, time.monotonic() + timeout_ms / 1000.0)
+                    self._send(payload, step.get("attachments"))
+                unsent = blocked
+                if not in_flight:
+                    continue
+
+                next_deadline = min(deadline for _, _, deadline in in_flight.values())
+                rec_json = waiter.get(next_deadline - time.monotonic())
+                # Take every reply already queued before deadlines are checked
+                while rec_json is not None:
+                    r_type = rec_json.get("reply type")
+                    entry = in_flight.get(rec_json.get("UUID"))
+                    if entry is not None and (r_type == entry[1] or r_type in ("ACK", "ERR")):
+                        del in_flight[rec_json["UUID"]]
+                        with self.waiters_lock:
+                            self.waiters.pop(rec_json["UUID"], None)
+                        status[entry[0]] = r_type
+                        yield BatchResult(entry[0], r_type, rec_json)
+                    rec_json = waiter.get(0)
+
+                now = time.monotonic()
+                for uuid_val, (i, wait_for, deadline) in list(in_flight.items()):
+                    if deadline <= now:
+                        del in_flight[uuid_val]
+                        with self.waiters_lock:
+                            self.waiters.pop(uuid_val, None)
+                        logger.warning("[CLIENT] Timeout waiting for %s (UUID: %s)", wait_for, uuid_val)
+                        status[i] = "TIMEOUT"
+                        yield BatchResult(i, "TIMEOUT", None)
+        finally:
+            with self.waiters_lock:
+                for uuid_val in in_flight:
+                    self.waiters.pop(uuid_val, None)
+
+    def iter_feedback(self, component, command, arg1="", arg2="", timeout_ms=10000, max_buffer=1000):
+        """
+        Sends a command and yields every FDB for it, then the final ACK/ERR.
+        Raises TimeoutError if the command does not finish within timeout_ms
+        (None waits as long as it takes).
+
+        max_buffer bounds the FDBs kept while the consumer is busy: when more
+        arrive, the oldest unread ones are dropped, so a component reporting at
+        kHz cannot flood a slow consumer. max_buffer=1 always yields the most
+        recent progress, None keeps them all. The final ACK/ERR is never dropped.
+
+            for msg in client.iter_feedback("recon", "start_recon", timeout_ms=None, max_buffer=1):
+                print(msg["reply type"], msg["reply"])
+        """
+        my_uuid = str(uuid.uuid4())
+        payload = self._create_payload(component, "", command, arg1, arg2, "", "SENT", my_uuid)
+        waiter = _FeedbackWaiter(my_uuid, max_buffer)
+        with self.waiters_lock:
+            self.waiters[my_uuid] = waiter
+        end_time = None if timeout_ms is None else time.monotonic() + timeout_ms / 1000.0
+        try:
+            traffic_log.debug("[CLIENT] Sending: %s to %s (UUID: %s)", command, component, my_uuid)
+            self._send(payload)
+            while True:
+                rec_json = waiter.get(None if end_time is None else max(0.0, end_time - time.monotonic()))
+                if rec_json is None:
+                    raise TimeoutError(f"{command} on {component} did not finish within {timeout_ms} ms")
+                yield rec_json
+                if rec_json.get("reply type") != "FDB":
+                    return
+        finally:
+            with self.waiters_lock:
+                self.waiters.pop(my_uuid, None)
+            if waiter.dropped:
+                traffic_log.debug("[CLIENT] Dropped %d stale FDB for %s (UUID: %s)", waiter.dropped, command, my_uuid)
+
+    def send_command_until(self, component, command, expected_feedback, interval_ms=500, timeout_ms=30000,
+                           on_progress=None):
+        """
+        Returns True once the component's reply to command equals
+        expected_feedback, False after timeout_ms.
+
+        The condition is evaluated next to the component: a single command
+        carries the poll parameters, listen_and_process re-runs the handler
+        every interval_ms and answers with one ACK on a match (ERR on timeout).
+        With on_progress(reply) the component also sends an FDB whenever the
+        handler's result changes. Components that do not mark their reply as
+        "polled" (older clients, other Acquila programs) are polled from here
+        instead, with one command per interval_ms.
+        """
+        logger.info("[CLIENT] REPEAT UNTIL '%s'...", expected_feedback)
+        end_time = time.monotonic() + timeout_ms / 1000.0
+        my_uuid = str(uuid.uuid4())
+        payload = self._create_payload(component, "", command, "", "", "", "SENT", my_uuid)
+        payload.update(_poll_fields(expected_feedback, interval_ms, timeout_ms, on_progress is not None))
+
+        waiter = _CommandWaiter(my_uuid)
+        with self.waiters_lock:
+            self.waiters[my_uuid] = waiter
+        try:
+            self._send(payload)
+            while True:
+                rec_json = waiter.get(end_time + self.POLL_GRACE_MS / 1000.0 - time.monotonic())
+                if rec_json is None:
+                    return False
+                r_type = rec_json.get("reply type")
+                if r_type == "FDB" and on_progress is not None:
+                    on_progress(rec_json.get("reply"))
+                elif r_type in ("ACK", "ERR"):
+                    if rec_json.get("polled"):
+                        return r_type == "ACK" and rec_json.get("reply") == str(expected_feedback)
+                    if r_type == "ACK" and rec_json.get("reply") == expected_feedback:
+                        return True
+                    break # The component ran the command once: keep polling from here
+        finally:
+            with self.waiters_lock:
+                self.waiters.pop(my_uuid, None)
+
+        time.sleep(interval_ms / 1000.0)
+        while time.monotonic() < end_time:
             response = self.send_command(component, command, wait_for="ACK", timeout_ms=2000)
             if response:
                 if response.get("reply") == expected_feedback:
@@ -212,45 +1085,116 @@ class AcquilaClient:
             time.sleep(interval_ms / 1000.0)
         return False
 
-    def listen_and_process(self, physical_name, callback_function):
-        print(f"[COMPONENT] Listening as: {physical_name}")
+    def listen_and_process(self, physical_name, callback_function, max_workers=None, use_processes=False,
+                           ordering_key=None):
+        """
+        Runs callback_function(client, data) for every command addressed to
+        physical_name, sending RCV before and ACK/ERR after it.
+
+        By default each callback runs inline, so a long command holds up the next
+        one. With max_workers=N the callbacks run on a pool of N threads (or N
+        processes with use_processes=True, for CPU-bound handlers) while this
+        loop keeps answering RCV immediately; ACK/ERR go out as each job ends.
+        Process-pool callbacks must be picklable top-level functions and get
+        None instead of the client, so they cannot send FDB. Workers are
+        spawned, not forked, so a script using them must start the component
+        under if __name__ == "__main__":.
+
+        ordering_key(data) -> hashable serialises commands that share a key (for
+        example lambda d: d["component"]); None as key means no ordering. A
+        command whose key cannot be computed gets an ERR and is not run.
+
+        Commands from send_command_until re-run callback_function until its
+        result matches. They occupy one worker, or without max_workers a thread
+        of their own, so other commands (a "stop", say) are still handled
+        meanwhile; callback_function must then tolerate concurrent calls.
+
+        In topic mode the loop starts once a probe echoed on the component's
+        topic shows its subscription is live (see wait_ready); commands
+        published before that point are dropped by ZMQ.
+        """
+        logger.info("[COMPONENT] Listening as: %s", physical_name)
+        dispatcher = None
+        if max_workers:
+            dispatcher = _CommandDispatcher(self, callback_function, max_workers, use_processes, ordering_key)
         
-        poller = zmq.Poller()
-        poller.register(self.socket_recv, zmq.POLLIN)
+        if self.inbox is None:
+            self.inbox = queue.Queue()
+        if self.topics:
+            self._subscribe(_component_topic(physical_name))
+            # Commands published before the subscription reaches the server are dropped unseen
+            if self.handshake_timeout_ms and not self.wait_ready(self.handshake_timeout_ms, component=physical_name):
+                logger.warning("[COMPONENT] Subscription of %s not confirmed by the server", physical_name)
         
         try:
             while True:
                 # Use a small timeout so the interpreter can catch KeyboardInterrupt (Ctrl-C)
-                socks = dict(poller.poll(timeout=200)) 
+                try:
+                    data = self.inbox.get(timeout=0.2)
+                except queue.Empty:
+                    continue
                 
-                if self.socket_recv in socks:
-                    msg = self.socket_recv.recv_string()
-                    data = json.loads(msg)
-                    
-                    if data.get("reply type") == "SENT":
-                        tgt_phys = data.get("comp_phys")
-                        tgt_abs = data.get("component")
-                        
-                        if tgt_phys == physical_name or tgt_abs == physical_name:
-                            print(f"[COMPONENT] Processing: {data.get('command')}")
-                            # 1. Send RCV
-                            ack_payload = data.copy()
-                            ack_payload["reply type"] = "RCV"
-                            self.socket_send.send_string(json.dumps(ack_payload))
-                            
-                            # 2. Execute Logic
-                            try:
-                                result = callback_function(self, data)
-                                ack_payload["reply type"] = "ACK"
-                                ack_payload["reply"] = str(result)
-                            except Exception as e:
-                                ack_payload["reply type"] = "ERR"
-                                ack_payload["reply"] = str(e)
-                            
-                            # 3. Send Final ACK/ERR
-                            self.socket_send.send_string(json.dumps(ack_payload))
+                tgt_phys = data.get("comp_phys")
+                tgt_abs = data.get("component")
+                
+                if tgt_phys == physical_name or tgt_abs == physical_name:
+                    traffic_log.debug("[COMPONENT] Processing: %s", data.get("command"))
+                    # 1. Send RCV
+                    ack_payload = data.copy()
+                    ack_payload.pop("attachments", None) # Only the command carries them
+                    ack_payload["reply type"] = "RCV"
+                    if "poll_until" in data:
+                        ack_payload["polled"] = True # Tells send_command_until the condition is evaluated here
+                    self._send(ack_payload)
+
+                    if dispatcher is not None:
+                        # 2./3. Run on the pool; the worker sends the final ACK/ERR
+                        dispatcher.submit(data, ack_payload)
+                    elif "poll_until" in data:
+                        # A polling loop can last seconds; keep this loop free for other commands
+                        threading.Thread(target=self._complete, args=(callback_function, data, ack_payload),
+                                         daemon=True).start()
+                    else:
+                        self._complete(callback_function, data, ack_payload)
         except KeyboardInterrupt:
-            print(f"\n[COMPONENT] Stop requested (Ctrl-C). Shutting down {physical_name}...")
+            logger.info("[COMPONENT] Stop requested (Ctrl-C). Shutting down %s...", physical_name)
         except Exception as e:
-            print(f"[COMPONENT] Loop error: {e}")
+            logger.exception("[COMPONENT] Loop error: %s", e)
             time.sleep(0.1)
+        finally:
+            if dispatcher is not None:
+                dispatcher.shutdown(wait=False)
+
+    def _complete(self, callback_function, data, ack_payload):
+        # 2. Execute Logic
+        try:
+            result = _execute(callback_function, self, data)
+            ack_payload["reply type"] = "ACK"
+            ack_payload["reply"] = str(result)
+        except Exception as e:
+            ack_payload["reply type"] = "ERR"
+            ack_payload["reply"] = str(e)
+
+        # 3. Send Final ACK/ERR
+        self._send(ack_payload)
+
+    def _subscribe(self, topic):
+        self.pending_subscriptions.put(topic)
+        with self.wake_lock:
+            self.wake_send.send(b"")
+
+    def close(self):
+        """Stops the receiver thread and closes its sockets."""
+        if not self.running:
+            return
+        self.running = False
+        if self.receiver_thread is not threading.current_thread():
+            self.receiver_thread.join(timeout=1.0)
+        for sock in (self.socket_send, self.socket_recv, self.wake_send, self.wake_recv):
+            try:
+                sock.close(linger=0)
+            except: pass
+
+# Imported last: these build on the definitions above
+from .aio import AsyncAcquilaClient
+from .pool import ClientPool, client_pool
@@ -0,0 +1,393 @@
+"""
+Asyncio-native Acquila client built on zmq.asyncio.
+
+All commands, feedback streams and served components of one AsyncAcquilaClient
+share a single event loop and a single PUB/SUB socket pair, so thousands of
+commands can be outstanding without a thread per command.
+"""
+
+import asyncio
+import collections
+import inspect
+import logging
+import uuid
+
+import zmq
+import zmq.asyncio
+
+from . import (DEFAULT_INBOUND_PORT, DEFAULT_OUTBOUND_PORT, PROBE_REPLY_TYPE, _BROADCAST_REPLY_TOPIC,
+               _component_topic, _create_payload, _endpoint, _on_component_topic, _poll_fields, _reply_topic)
+from .attach import attachment_frame
+from .codec import CodecError, decode_payload, get_codec
+from .log import TRAFFIC_LOGGER
+
+logger = logging.getLogger(__name__)
+traffic_log = logging.getLogger(TRAFFIC_LOGGER)
+
+FINAL_REPLY_TYPES = ("ACK", "ERR")
+
+class _FeedbackQueue:
+    """asyncio counterpart of acquila_zmq._FeedbackWaiter, fed by the receiver task."""
+    def __init__(self, max_buffer=None):
+        self.messages = collections.deque(maxlen=max_buffer)
+        self.final = None
+        self.dropped = 0
+        self.event = asyncio.Event()
+
+    def put_nowait(self, data):
+        r_type = data.get("reply type")
+        if r_type == "FDB":
+            if len(self.messages) == self.messages.maxlen:
+                self.dropped += 1
+            self.messages.append(data)
+        elif r_type in FINAL_REPLY_TYPES:
+            self.final = data
+        else:
+            return
+        self.event.set()
+
+    async def get(self):
+        while not self.messages and self.final is None:
+            self.event.clear()
+            await self.event.wait()
+        if self.messages:
+            return self.messages.popleft()
+        final, self.final = self.final, None
+        return final
+
+class AsyncAcquilaClient:
+    """
+    Usage:
+
+        async with AsyncAcquilaClient() as client:
+            reply = await client.send_command("motor_X", "move_abs", arg1="10")
+
+    Endpoints work as for AcquilaClient. The default context shadows the
+    process-wide zmq.Context.instance(), so "inproc://" endpoints reach a
+    server running in the same process.
+    """
+    POLL_GRACE_MS = 1000 # See AcquilaClient.POLL_GRACE_MS
+
+    def __init__(self, server_ip="127.0.0.1", outbound_port=DEFAULT_OUTBOUND_PORT, inbound_port=DEFAULT_INBOUND_PORT,
+                 topics=False, codec="json", context=None, handshake_timeout_ms=1000):
+        self.context = context or zmq.asyncio.Context(zmq.Context.instance())
+        self.uuid = str(uuid.uuid4())
+        self.topics = topics
+        self.codec = get_codec(codec)
+        self.server_ip = server_ip
+        self.outbound_port = outbound_port
+        self.inbound_port = inbound_port
+        self.outbound_endpoint = _endpoint(outbound_port, server_ip)
+        self.inbound_endpoint = _endpoint(inbound_port, server_ip)
+
+        self.socket_send = self.context.socket(zmq.PUB)
+        self.socket_send.connect(self.inbound_endpoint)
+
+        self.socket_recv = self.context.socket(zmq.SUB)
+        self.socket_recv.connect(self.outbound_endpoint)
+        if topics:
+            self.socket_recv.setsockopt(zmq.SUBSCRIBE, _reply_topic(self.uuid))
+            self.socket_recv.setsockopt(zmq.SUBSCRIBE, _BROADCAST_REPLY_TOPIC)
+        else:
+            self.socket_recv.setsockopt_string(zmq.SUBSCRIBE, "")
+
+        self.waiters = {} # Pending commands by UUID -> asyncio.Queue
+        self.listeners = {} # Served physical names -> asyncio.Queue of SENT messages
+        self.receiver_task = None
+        self.handshake_timeout_ms = handshake_timeout_ms
+        self.ready = False
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def connect(self):
+        """Starts the receiver task and waits until a probe echoed by the server proves the path is live."""
+        self._ensure_receiver()
+        logger.info("[CLIENT] Connected to %s (in) / %s (out)", self.inbound_endpoint, self.outbound_endpoint)
+        if self.handshake_timeout_ms:
+            self.ready = await self.wait_ready(self.handshake_timeout_ms)
+
+    async def wait_ready(self, timeout_ms=1000, interval_ms=10, component=""):
+        """Async version of AcquilaClient.wait_ready."""
+        self._ensure_receiver()
+        probe_uuid = str(uuid.uuid4())
+        waiter = asyncio.Queue()
+        self.waiters[probe_uuid] = waiter
+        loop = asyncio.get_running_loop()
+        end_time = loop.time() + timeout_ms / 1000.0
+        try:
+            while loop.time() < end_time:
+                await self._send(_create_payload(component, "", "", "", "", "", PROBE_REPLY_TYPE, probe_uuid))
+                try:
+                    await asyncio.wait_for(waiter.get(), min(interval_ms / 1000.0, max(0.0, end_time - loop.time())))
+                    return True
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self.waiters.pop(probe_uuid, None)
+        logger.warning("[CLIENT] No handshake echo from the server within %s ms", timeout_ms)
+        return False
+
+    def _ensure_receiver(self):
+        if self.receiver_task is None:
+            self.receiver_task = asyncio.get_running_loop().create_task(self._receive_loop())
+
+    async def _receive_loop(self):
+        """Parses each inbound message once and routes it by UUID and target component."""
+        while True:
+            try:
+                frames = await self.socket_recv.recv_multipart(copy=False)
+            except zmq.ZMQError as e:
+                logger.error("[CLIENT] Receive error: %s", e)
+                break
+
+            try:
+                data = decode_payload(frames[-1].buffer)
+            except CodecError:
+                traffic_log.warning("[CLIENT] Raw string received: %s", frames[-1].bytes.decode("utf-8", errors="replace"))
+                continue
+            # One bad message must not end the task every send_command depends on
+            try:
+                uuid_val = data.get("UUID")
+                if not isinstance(uuid_val, str):
+                    traffic_log.warning("[CLIENT] Ignoring message without a string UUID: %s", data)
+                    continue
+                attachments = frames[1 if self.topics else 0:-1]
+                if attachments:
+                    data["attachments"] = [frame.buffer for frame in attachments]
+
+                waiter = self.waiters.get(uuid_val)
+                if waiter is not None:
+                    waiter.put_nowait(data)
+
+                if (self.listeners and data.get("reply type") == "SENT"
+                        and (not self.topics or _on_component_topic(frames[0]))):
+                    for name in {data.get("comp_phys"), data.get("component")}:
+                        inbox = self.listeners.get(name)
+                        if inbox is not None:
+                            inbox.put_nowait(data)
+            except Exception as e:
+                logger.exception("[CLIENT] Dropped a message that could not be routed: %s", e)
+
+    async def _send(self, payload, attachments=None):
+        body = self.codec.encode(payload)
+        frames = [*map(attachment_frame, attachments or ()), body]
+        if self.topics:
+            frames.insert(0, self.uuid.encode("utf-8"))
+        if len(frames) > 1:
+            await self.socket_send.send_multipart(frames, copy=False)
+        else:
+            await self.socket_send.send(body)
+
+    async def _send_tracked(self, component, command, arg1, arg2, extra=None, waiter=None, attachments=None):
+        self._ensure_receiver()
+        my_uuid = str(uuid.uuid4())
+        waiter = waiter or asyncio.Queue()
+        self.waiters[my_uuid] = waiter # Register before sending so no reply can be missed
+        payload = _create_payload(component, "", command, arg1, arg2, "", "SENT", my_uuid)
+        if extra:
+            payload.update(extra)
+        await self._send(payload, attachments)
+        return my_uuid, waiter
+
+    async def send_feedback(self, original_command_data, feedback_msg, attachments=None):
+        payload = _create_payload(
+            component=original_command_data.get("component"),
+            comp_phys=original_command_data.get("comp_phys"),
+            command=original_command_data.get("command"),
+            arg1=original_command_data.get("arg1"),
+            arg2=original_command_data.get("arg2"),
+            reply=feedback_msg,
+            reply_type="FDB",
+            uuid_val=original_command_data.get("UUID")
+        )
+        await self._send(payload, attachments)
+
+    async def send_command(self, component, command, arg1="", arg2="", wait_for="ACK", timeout_ms=10000,
+                           attachments=None):
+        """
+        Same contract as AcquilaClient.send_command: returns the first reply of type
+        wait_for, or None on timeout ("no wait" returns None right after sending).
+        """
+        if wait_for == "no wait":
+            await self._send(_create_payload(component, "", command, arg1, arg2, "", "SENT"), attachments)
+            return None
+
+        my_uuid, waiter = await self._send_tracked(component, command, arg1, arg2, attachments=attachments)
+        loop = asyncio.get_running_loop()
+        end_time = loop.time() + timeout_ms / 1000.0
+        try:
+            while True:
+                remaining = end_time - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    rec_json = await asyncio.wait_for(waiter.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if rec_json.get("reply type") == wait_for:
+                    return rec_json
+        finally:
+            self.waiters.pop(my_uuid, None)
+
+        logger.warning("[CLIENT] Timeout waiting for %s (UUID: %s)", wait_for, my_uuid)
+        return None
+
+    async def iter_feedback(self, component, command, arg1="", arg2="", timeout_ms=10000, max_buffer=1000):
+        """
+        Sends a command and yields every FDB for it, then the final ACK/ERR.
+        Raises asyncio.TimeoutError if the command does not finish within
+        timeout_ms (None waits as long as it takes). max_buffer bounds the
+        unread FDBs as for AcquilaClient.iter_feedback: the oldest are dropped
+        first, the final ACK/ERR never.
+
+            async for msg in client.iter_feedback("recon", "start_recon", max_buffer=1):
+                print(msg["reply type"], msg["reply"])
+        """
+        waiter = _FeedbackQueue(max_buffer)
+        my_uuid, _ = await self._send_tracked(component, command, arg1, arg2, waiter=waiter)
+        loop = asyncio.get_running_loop()
+        end_time = None if timeout_ms is None else loop.time() + timeout_ms / 1000.0
+        try:
+            while True:
+                rec_json = await asyncio.wait_for(waiter.get(), None if end_time is None else
+                                                  max(0.0, end_time - loop.time()))
+                yield rec_json
+                if rec_json.get("reply type") in FINAL_REPLY_TYPES:
+                    return
+        finally:
+            self.waiters.pop(my_uuid, None)
+            if waiter.dropped:
+                traffic_log.debug("[CLIENT] Dropped %d stale FDB for %s (UUID: %s)", waiter.dropped, command, my_uuid)
+
+    async def send_command_until(self, component, command, expected_feedback, interval_ms=500, timeout_ms=30000,
+                                 on_progress=None):
+        """
+        Same contract as AcquilaClient.send_command_until: the condition is
+        evaluated by the component when it supports it, otherwise polled from
+        here. on_progress(reply) may be a coroutine function.
+        """
+        loop = asyncio.get_running_loop()
+        end_time = loop.time() + timeout_ms / 1000.0
+        my_uuid, waiter = await self._send_tracked(
+            component, command, "", "", _poll_fields(expected_feedback, interval_ms, timeout_ms, on_progress is not None))
+        try:
+            while True:
+                try:
+                    rec_json = await asyncio.wait_for(
+                        waiter.get(), max(0.0, end_time + self.POLL_GRACE_MS / 1000.0 - loop.time()))
+                except asyncio.TimeoutError:
+                    return False
+                r_type = rec_json.get("reply type")
+                if r_type == "FDB" and on_progress is not None:
+                    result = on_progress(rec_json.get("reply"))
+                    if inspect.isawaitable(result):
+                        await result
+                elif r_type in FINAL_REPLY_TYPES:
+                    if rec_json.get("polled"):
+                        return r_type == "ACK" and rec_json.get("reply") == str(expected_feedback)
+                    if r_type == "ACK" and rec_json.get("reply") == expected_feedback:
+                        return True
+                    break # The component ran the command once: keep polling from here
+        finally:
+            self.waiters.pop(my_uuid, None)
+
+        await asyncio.sleep(interval_ms / 1000.0)
+        while loop.time() < end_time:
+            response = await self.send_command(component, command, wait_for="ACK", timeout_ms=2000)
+            if response and response.get("reply") == expected_feedback:
+                return True
+            await asyncio.sleep(interval_ms / 1000.0)
+        return False
+
+    async def serve(self, physical_name, handler):
+        """
+        Async equivalent of AcquilaClient.listen_and_process. handler(client, data)
+        may be a coroutine function; every command runs in its own task so slow
+        commands do not hold up the RCV of the next one. Runs until cancelled.
+        In topic mode it first waits for its subscription to be confirmed, as
+        AcquilaClient.listen_and_process does.
+        """
+        logger.info("[COMPONENT] Listening as: %s", physical_name)
+        self._ensure_receiver()
+        inbox = self.listeners.setdefault(physical_name, asyncio.Queue())
+        tasks = set()
+        try:
+            if self.topics:
+                self.socket_recv.setsockopt(zmq.SUBSCRIBE, _component_topic(physical_name))
+                if self.handshake_timeout_ms and not await self.wait_ready(self.handshake_timeout_ms,
+                                                                           component=physical_name):
+                    logger.warning("[COMPONENT] Subscription of %s not confirmed by the server", physical_name)
+            while True:
+                data = await inbox.get()
+                task = asyncio.get_running_loop().create_task(self._process(data, handler))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            self.listeners.pop(physical_name, None)
+            for task in tasks:
+                task.cancel()
+
+    async def _process(self, data, handler):
+        # 1. Send RCV
+        ack_payload = data.copy()
+        ack_payload.pop("attachments", None) # Only the command carries them
+        ack_payload["reply type"] = "RCV"
+        if "poll_until" in data:
+            ack_payload["polled"] = True # Tells send_command_until the condition is evaluated here
+        await self._send(ack_payload)
+
+        # 2. Execute Logic
+        ack_payload = ack_payload.copy()
+        try:
+            if "poll_until" in data:
+                result = await self._poll_until(handler, data)
+            else:
+                result = handler(self, data)
+                if inspect.isawaitable(result):
+                    result = await result
+            ack_payload["reply type"] = "ACK"
+            ack_payload["reply"] = str(result)
+        except Exception as e:
+            ack_payload["reply type"] = "ERR"
+            ack_payload["reply"] = str(e)
+
+        # 3. Send Final ACK/ERR
+        await self._send(ack_payload)
+
+    async def _poll_until(self, handler, data):
+        """Async version of acquila_zmq._poll_until."""
+        expected = str(data["poll_until"])
+        interval_s = float(data.get("poll_interval_ms", 500)) / 1000.0
+        loop = asyncio.get_running_loop()
+        end_time = loop.time() + float(data.get("poll_timeout_ms", 30000)) / 1000.0
+        last = None
+        while True:
+            result = handler(self, data)
+            if inspect.isawaitable(result):
+                result = await result
+            result = str(result)
+            if result == expected:
+                return result
+            if result != last and data.get("poll_progress"):
+                await self.send_feedback(data, result)
+            last = result
+            if loop.time() + interval_s > end_time:
+                raise TimeoutError(f"Still '{result}' after {data.get('poll_timeout_ms')} ms, expected '{expected}'")
+            await asyncio.sleep(interval_s)
+
+    async def close(self):
+        """Cancels the receiver task and closes both sockets."""
+        if self.receiver_task is not None:
+            self.receiver_task.cancel()
+            try:
+                await self.receiver_task
+            except asyncio.CancelledError:
+                pass
+            self.receiver_task = None
+        self.socket_send.close(linger=0)
+        self.socket_recv.close(linger=0)
@@ -0,0 +1,116 @@
+"""
+Binary attachments for Acquila messages.
+
+Attachments travel as extra ZMQ frames in front of the payload body, which
+stays the last frame so peers that only read frames[-1] are unaffected:
+
+    client -> server   [client UUID (topic mode only), attachment..., body]
+    server -> clients  [topic (topic mode only), attachment..., body]
+
+They are sent and received zero-copy (copy=False) and the server relays them
+without looking at them. A receiver finds them as a list of buffers under
+data["attachments"]; the key exists only on the receiving side and is never
+encoded into a payload.
+
+For peers on the same host, a SharedAttachment puts the bytes in shared memory
+and sends only a small handle frame. open_attachment() gives a memoryview of
+either kind:
+
+    with open_attachment(data["attachments"][0]) as buf:
+        image = numpy.frombuffer(buf, dtype=numpy.uint16).reshape(512, 512)
+"""
+
+import contextlib
+import json
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError: # Python 3.7: attachment frames work, shared memory does not
+    shared_memory = None
+
+_SHM_TAG = b"\xc1H" # Handle frame of a SharedAttachment; 0xC1 also starts the binary codec tags
+_created = set() # Names of the blocks this process created and still owns
+
+class SharedAttachment:
+    """
+    A buffer in shared memory, attached to a message by handle instead of by
+    value. Create it from bytes-like data, or with size=n and fill .buf
+    in place. The sender owns the block: release() it once the receiver is
+    done (for a command, after its ACK), or use it as a context manager.
+    """
+    def __init__(self, data=None, size=None):
+        if shared_memory is None:
+            raise ImportError("SharedAttachment requires Python 3.8 or newer (multiprocessing.shared_memory)")
+        if data is not None:
+            data = memoryview(data).cast("B")
+            size = data.nbytes
+        self.size = size
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.buf = self.shm.buf[:size]
+        _created.add(self.shm.name)
+        if data is not None:
+            self.buf[:] = data
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def handle(self):
+        """The frame sent in place of the data."""
+        return _SHM_TAG + json.dumps({"shm": self.name, "size": self.size}).encode("utf-8")
+
+    def release(self):
+        """Unmaps and removes the block; receivers must be done with it."""
+        if self.shm is None:
+            return
+        self.buf.release()
+        self.shm.close()
+        self.shm.unlink()
+        _created.discard(self.shm.name)
+        self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+def attachment_frame(attachment):
+    """What goes on the wire for one attachment: the SharedAttachment handle or the buffer itself."""
+    return attachment.handle() if isinstance(attachment, SharedAttachment) else attachment
+
+def is_shared(frame):
+    return bytes(frame[:len(_SHM_TAG)]) == _SHM_TAG
+
+def _open_shared(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False) # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        # Older Pythons track every opened block and remove it when this process exits,
+        # although the block belongs to the sender (unless that is this process)
+        if name not in _created:
+            try:
+                resource_tracker.unregister(shm._name, "shared_memory")
+            except Exception:
+                pass
+        return shm
+
+@contextlib.contextmanager
+def open_attachment(frame):
+    """
+    Context manager yielding a memoryview of a received attachment: the frame
+    itself, or the mapped block of a SharedAttachment, unmapped on exit (views
+    of it must not be used afterwards).
+    """
+    if not is_shared(frame):
+        yield memoryview(frame)
+        return
+    info = json.loads(bytes(frame[len(_SHM_TAG):]))
+    shm = _open_shared(info["shm"])
+    view = shm.buf[:info["size"]]
+    try:
+        yield view
+    finally:
+        view.release()
+        shm.close()
@@ -0,0 +1,284 @@
+"""
+Payload codecs for the Acquila bus.
+
+A client encodes what it sends with its own codec; every peer decodes with
+decode_payload(), which recognises the codec from the first bytes of the frame.
+JSON stays the default so the bus remains compatible with the Acquila main
+program; the binary codecs start with a two-byte tag that can never begin a
+JSON document.
+"""
+
+import json
+import re
+import struct
+
+try:
+    import msgpack
+except ImportError: # Optional dependency: pip install acquila_zmq[msgpack]
+    msgpack = None
+
+_MSGPACK_TAG = b"\xc1M" # 0xC1 is never used by msgpack itself
+_STRUCT_TAG = b"\xc1S"
+
+# Header keys as json.dumps writes them, found with bytes.find; with other spacing the payload
+# is decoded in full, except for a UUID, which falls back to its pattern. Inside a JSON string the quotes would be escaped, so these never match string
+# contents, but they do match keys of nested objects: the first match is taken, which is the
+# header key for payloads that put it before any nested value, as _create_payload does.
+_JSON_REPLY_TYPE_KEY = b'"reply type": "'
+_JSON_UUID_KEY = b'"UUID": "'
+_PROGRESS_TYPES = (b'RCV"', b'FDB"') # Reply type values, with their closing quote
+_JSON_UUID = re.compile(rb'"UUID"\s*:\s*"([^"\\]*)"')
+
+class CodecError(ValueError):
+    """Raised when a frame cannot be decoded into an Acquila payload."""
+
+class JsonCodec:
+    """The original wire format: one UTF-8 JSON object per message."""
+    name = "json"
+
+    def encode(self, data):
+        return json.dumps(data).encode("utf-8")
+
+    def decode(self, buf):
+        try:
+            data = json.loads(bytes(buf))
+        except ValueError as e:
+            raise CodecError(f"Invalid JSON payload: {e}") from e
+        if not isinstance(data, dict):
+            raise CodecError("JSON payload is not an object")
+        return data
+
+class MsgpackCodec:
+    """msgpack with one-letter keys for the standard fields; other keys go under "x"."""
+    name = "msgpack"
+    SHORT_KEYS = {
+        "component": "c", "comp_phys": "p", "command": "m", "arg1": "a", "arg2": "b",
+        "reply": "r", "reply type": "t", "comp_type": "k", "tick count": "n", "UUID": "u",
+    }
+    LONG_KEYS = {v: k for k, v in SHORT_KEYS.items()}
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError("The msgpack codec requires the 'msgpack' package (pip install msgpack)")
+
+    def encode(self, data):
+        packed = {}
+        extras = {}
+        for key, value in data.items():
+            short = self.SHORT_KEYS.get(key)
+            if short:
+                packed[short] = value
+            else:
+                extras[key] = value
+        if extras:
+            packed["x"] = extras
+        return _MSGPACK_TAG + msgpack.packb(packed, use_bin_type=True)
+
+    def decode(self, buf):
+        if msgpack is None:
+            raise CodecError("Received a msgpack payload but the 'msgpack' package is not installed")
+        try:
+            packed = msgpack.unpackb(bytes(buf)[len(_MSGPACK_TAG):], raw=False)
+        except Exception as e:
+            raise CodecError(f"Invalid msgpack payload: {e}") from e
+        if not isinstance(packed, dict):
+            raise CodecError("msgpack payload is not a map")
+        extras = packed.pop("x", {})
+        if not isinstance(extras, dict):
+            raise CodecError("msgpack payload extras are not a map")
+        data = {self.LONG_KEYS.get(k, k): v for k, v in packed.items()}
+        data.update(extras)
+        return data
+
+class StructCodec:
+    """
+    Fixed binary schema: a header with a presence mask, reply type code and tick
+    count, the UUID as 16 raw bytes when it is canonical, length-prefixed UTF-8
+    strings, and any non-standard keys as a trailing JSON blob.
+    """
+    name = "struct"
+    STRING_FIELDS = ("component", "comp_phys", "command", "arg1", "arg2", "reply", "comp_type")
+    REPLY_TYPES = ("SENT", "RCV", "FDB", "ACK", "ERR")
+
+    # Presence bits, after one bit per STRING_FIELDS entry
+    _BIT_REPLY_TYPE = 1 << 7
+    _BIT_TICK = 1 << 8
+    _BIT_UUID_BYTES = 1 << 9
+    _BIT_UUID_STR = 1 << 10
+    _BIT_EXTRAS = 1 << 11
+
+    _HEADER = struct.Struct("<2sHBq") # tag, presence mask, reply type code, tick count
+    _LENGTH = struct.Struct("<I")
+
+    def encode(self, data):
+        data = dict(data)
+        mask = 0
+        parts = []
+
+        for bit, key in enumerate(self.STRING_FIELDS):
+            value = data.get(key)
+            if isinstance(value, str):
+                del data[key]
+                mask |= 1 << bit
+                raw = value.encode("utf-8")
+                parts.append(self._LENGTH.pack(len(raw)))
+                parts.append(raw)
+
+        r_code = 0
+        if data.get("reply type") in self.REPLY_TYPES:
+            r_code = self.REPLY_TYPES.index(data.pop("reply type")) + 1
+            mask |= self._BIT_REPLY_TYPE
+
+        tick = 0
+        value = data.get("tick count")
+        if type(value) is int and -2**63 <= value < 2**63:
+            tick = data.pop("tick count")
+            mask |= self._BIT_TICK
+
+        value = data.get("UUID")
+        if isinstance(value, str):
+            del data["UUID"]
+            raw = _uuid_to_bytes(value)
+            if raw is not None:
+                mask |= self._BIT_UUID_BYTES
+                parts.append(raw)
+            else:
+                mask |= self._BIT_UUID_STR
+                raw = value.encode("utf-8")
+                parts.append(self._LENGTH.pack(len(raw)))
+                parts.append(raw)
+
+        if data:
+            # Whatever is left (non-standard keys, non-string values) travels as JSON
+            mask |= self._BIT_EXTRAS
+            raw = json.dumps(data).encode("utf-8")
+            parts.append(self._LENGTH.pack(len(raw)))
+            parts.append(raw)
+
+        return self._HEADER.pack(_STRUCT_TAG, mask, r_code, tick) + b"".join(parts)
+
+    def decode(self, buf):
+        buf = memoryview(buf)
+        try:
+            _, mask, r_code, tick = self._HEADER.unpack_from(buf, 0)
+            pos = self._HEADER.size
+            data = {}
+
+            for bit, key in enumerate(self.STRING_FIELDS):
+                if mask & (1 << bit):
+                    data[key], pos = self._read_str(buf, pos)
+            if mask & self._BIT_REPLY_TYPE:
+                data["reply type"] = self.REPLY_TYPES[r_code - 1]
+            if mask & self._BIT_TICK:
+                data["tick count"] = tick
+            if mask & self._BIT_UUID_BYTES:
+                data["UUID"] = _uuid_from_bytes(buf[pos:pos + 16])
+                pos += 16
+            elif mask & self._BIT_UUID_STR:
+                data["UUID"], pos = self._read_str(buf, pos)
+            if mask & self._BIT_EXTRAS:
+                extras, pos = self._read_str(buf, pos)
+                extras = json.loads(extras)
+                if not isinstance(extras, dict):
+                    raise ValueError("extras are not a JSON object")
+                data.update(extras)
+        except (struct.error, IndexError, ValueError) as e:
+            raise CodecError(f"Invalid struct payload: {e}") from e
+        return data
+
+    def peek(self, buf):
+        """Reads reply type and UUID by skipping over the string fields."""
+        buf = memoryview(buf)
+        _, mask, r_code, _ = self._HEADER.unpack_from(buf, 0)
+        r_type = self.REPLY_TYPES[r_code - 1] if mask & self._BIT_REPLY_TYPE else None
+        pos = self._HEADER.size
+        for bit in range(len(self.STRING_FIELDS)):
+            if mask & (1 << bit):
+                (length,) = self._LENGTH.unpack_from(buf, pos)
+                pos += self._LENGTH.size + length
+        uuid_val = None
+        if mask & self._BIT_UUID_BYTES:
+            uuid_val = _uuid_from_bytes(buf[pos:pos + 16])
+        elif mask & self._BIT_UUID_STR:
+            uuid_val, pos = self._read_str(buf, pos)
+        return r_type, uuid_val
+
+    def _read_str(self, buf, pos):
+        (length,) = self._LENGTH.unpack_from(buf, pos)
+        pos += self._LENGTH.size
+        if pos + length > len(buf):
+            raise ValueError("string field runs past the end of the frame")
+        return str(buf[pos:pos + length], "utf-8"), pos + length
+
+def _uuid_to_bytes(value):
+    """16 raw bytes for a canonical lowercase UUID string, None for anything else."""
+    if len(value) != 36:
+        return None
+    try:
+        raw = bytes.fromhex(value.replace("-", ""))
+    except ValueError:
+        return None
+    # Only exact round trips qualify (hyphen positions, lowercase hex)
+    return raw if len(raw) == 16 and _uuid_from_bytes(raw) == value else None
+
+def _uuid_from_bytes(raw):
+    h = raw.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+_CODECS = {"json": JsonCodec, "msgpack": MsgpackCodec, "struct": StructCodec}
+_JSON = JsonCodec()
+_STRUCT = StructCodec()
+_MSGPACK = MsgpackCodec() if msgpack is not None else None
+
+def get_codec(codec="json"):
+    """Returns a codec instance from a name ("json", "msgpack", "struct") or passes one through."""
+    if not isinstance(codec, str):
+        return codec
+    try:
+        return _CODECS[codec]()
+    except KeyError:
+        raise ValueError(f"Unknown codec '{codec}', expected one of {sorted(_CODECS)}") from None
+
+def decode_payload(buf):
+    """Decodes a frame produced by any codec; raises CodecError if it is not a payload."""
+    head = bytes(memoryview(buf)[:2])
+    if head == _STRUCT_TAG:
+        return _STRUCT.decode(buf)
+    if head == _MSGPACK_TAG:
+        if _MSGPACK is None:
+            raise CodecError("Received a msgpack payload but the 'msgpack' package is not installed")
+        return _MSGPACK.decode(buf)
+    return _JSON.decode(buf)
+
+def _json_field(buf, key, pattern):
+    start = buf.find(key)
+    if start >= 0:
+        start += len(key)
+        end = buf.find(b'"', start)
+        if end >= 0 and b"\\" not in buf[start:end]:
+            return buf[start:end].decode("utf-8", errors="replace")
+    match = pattern.search(buf)
+    return match.group(1).decode("utf-8", errors="replace") if match else None
+
+def peek_progress(buf):
+    """
+    (reply type, UUID) of an RCV or FDB frame (bytes), read without decoding the
+    payload. None for any other reply type, or when the header cannot be read
+    cheaply; callers then decode the payload.
+    """
+    if buf[:1] != b"\xc1": # Not a binary codec tag, so JSON
+        start = buf.find(_JSON_REPLY_TYPE_KEY)
+        if start < 0:
+            return None
+        start += len(_JSON_REPLY_TYPE_KEY)
+        if buf[start:start + 4] not in _PROGRESS_TYPES:
+            return None
+        uuid_val = _json_field(buf, _JSON_UUID_KEY, _JSON_UUID)
+        return (buf[start:start + 3].decode("ascii"), uuid_val) if uuid_val else None
+    if buf[:2] != _STRUCT_TAG:
+        return None # A full msgpack decode is as cheap as any partial one
+    try:
+        r_type, uuid_val = _STRUCT.peek(buf)
+    except (struct.error, IndexError, ValueError):
+        return None
+    return (r_type, uuid_val) if r_type in ("RCV", "FDB") and uuid_val else None
@@ -0,0 +1,117 @@
+"""
+Logging setup for the Acquila ZMQ library.
+
+Every module logs to its own logger (logging.getLogger(__name__)); lines that are
+emitted once per message on the bus go to the shared TRAFFIC_LOGGER at DEBUG so
+they can be enabled, sampled or rate limited independently of the rest.
+
+The library itself only installs a NullHandler. Applications that want console
+output call configure_logging(), which hands records to a background thread
+through a bounded queue so a slow console can never stall a relay loop.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+TRAFFIC_LOGGER = "acquila_zmq.traffic"
+
+DEFAULT_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket limiting records to max_per_second (with bursts of up to burst
+    records); sample_every=N additionally keeps only every Nth record. The next
+    record that passes reports how many were suppressed in between.
+    """
+    def __init__(self, max_per_second=100.0, burst=None, sample_every=1):
+        super().__init__()
+        self.max_per_second = float(max_per_second)
+        self.burst = float(burst if burst is not None else max(1.0, max_per_second))
+        self.sample_every = max(1, int(sample_every))
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.seen = 0
+        self.suppressed = 0
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        with self.lock:
+            self.seen += 1
+            if self.seen % self.sample_every:
+                self.suppressed += 1
+                return False
+
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.max_per_second)
+            self.last = now
+            if self.tokens < 1.0:
+                self.suppressed += 1
+                return False
+            self.tokens -= 1.0
+
+            if self.suppressed:
+                record.msg = f"{record.msg} [{self.suppressed} similar lines suppressed]"
+                self.suppressed = 0
+        return True
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: when the queue is full the record is dropped and counted."""
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_listener = None
+
+def configure_logging(level=logging.INFO, traffic_level=None, traffic_rate=100.0, traffic_sample_every=1,
+                      stream=None, fmt=DEFAULT_FORMAT, queue_size=10000):
+    """
+    Sends the library's log records to stream (default stderr) from a background
+    thread. traffic_level sets the per-message logger separately (defaults to
+    level); traffic_rate/traffic_sample_every bound how many of those lines get
+    through. Calling it again replaces the previous configuration. Returns the
+    DroppingQueueHandler, whose .dropped counts records lost to a full queue.
+    """
+    global _listener
+    stop_logging()
+
+    stream_handler = logging.StreamHandler(stream if stream is not None else sys.stderr)
+    stream_handler.setFormatter(logging.Formatter(fmt))
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+    _listener = logging.handlers.QueueListener(queue_handler.queue, stream_handler)
+    _listener.start()
+
+    lib_logger = logging.getLogger("acquila_zmq")
+    for handler in [h for h in lib_logger.handlers if isinstance(h, DroppingQueueHandler)]:
+        lib_logger.removeHandler(handler)
+    lib_logger.addHandler(queue_handler)
+    lib_logger.setLevel(level)
+    lib_logger.propagate = False
+
+    traffic_logger = logging.getLogger(TRAFFIC_LOGGER)
+    traffic_logger.setLevel(traffic_level if traffic_level is not None else level)
+    for old in [f for f in traffic_logger.filters if isinstance(f, RateLimitFilter)]:
+        traffic_logger.removeFilter(old)
+    if traffic_rate or traffic_sample_every > 1:
+        traffic_logger.addFilter(RateLimitFilter(traffic_rate or float("inf"), sample_every=traffic_sample_every))
+    return queue_handler
+
+def stop_logging():
+    """Flushes and stops the background logging thread started by configure_logging()."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+atexit.register(stop_logging)
+logging.getLogger("acquila_zmq").addHandler(logging.NullHandler())
@@ -0,0 +1,77 @@
+"""
+Reuse of connected AcquilaClient instances.
+
+Creating a client costs two socket connects, a receiver thread and the PUB/SUB
+handshake. Short-lived users (script runs, test harnesses, CLI tools) can check
+a warmed-up client out of a ClientPool instead and hand it back when done.
+"""
+
+import contextlib
+import threading
+
+from . import DEFAULT_INBOUND_PORT, DEFAULT_OUTBOUND_PORT, AcquilaClient
+
+class ClientPool:
+    """
+    Idle clients keyed by (server_ip, outbound_port, inbound_port, options).
+
+        with client_pool.client("127.0.0.1") as client:
+            client.send_command("motor_X", "move_abs", arg1="10")
+
+    A checked-out client belongs to one user until it is released. Clients that
+    were used with listen_and_process are closed on release instead of pooled.
+    """
+    def __init__(self, max_idle_per_key=4):
+        self.max_idle_per_key = max_idle_per_key
+        self.idle = {} # key -> list of idle AcquilaClient
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _key(server_ip, outbound_port, inbound_port, options):
+        return (server_ip, outbound_port, inbound_port, tuple(sorted(options.items())))
+
+    def acquire(self, server_ip="127.0.0.1", outbound_port=DEFAULT_OUTBOUND_PORT, inbound_port=DEFAULT_INBOUND_PORT,
+                **options):
+        """Returns an idle client for this server, or a new one. options are passed to AcquilaClient."""
+        key = self._key(server_ip, outbound_port, inbound_port, options)
+        with self.lock:
+            idle = self.idle.get(key)
+            if idle:
+                return idle.pop()
+
+        client = AcquilaClient(server_ip=server_ip, outbound_port=outbound_port, inbound_port=inbound_port, **options)
+        client.pool_key = key
+        return client
+
+    def release(self, client):
+        """Hands a client back; it is closed instead if it cannot be reused or the pool is full."""
+        key = getattr(client, "pool_key", None)
+        if key is None or not client.running or client.inbox is not None:
+            client.close()
+            return
+        with self.lock:
+            idle = self.idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_key:
+                idle.append(client)
+                return
+        client.close()
+
+    @contextlib.contextmanager
+    def client(self, server_ip="127.0.0.1", outbound_port=DEFAULT_OUTBOUND_PORT, inbound_port=DEFAULT_INBOUND_PORT,
+               **options):
+        """Context manager around acquire()/release()."""
+        client = self.acquire(server_ip, outbound_port, inbound_port, **options)
+        try:
+            yield client
+        finally:
+            self.release(client)
+
+    def close(self):
+        """Closes every idle client."""
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for clients in idle.values():
+            for client in clients:
+                client.close()
+
+client_pool = ClientPool() # Process-wide default pool
@@ -0,0 +1,181 @@
+"""
+Binary recording of the traffic a server publishes.
+
+A TrafficRecorder subscribes to a server's outbound socket and appends every
+message, with a nanosecond receive timestamp, to segment files in a directory.
+Segments are append-only and rotated by size; existing recordings are never
+overwritten. Each segment starts with SEGMENT_MAGIC followed by records:
+
+    int64   receive time, ns since the epoch
+    uint16  number of frames
+    then per frame: uint32 length + the raw frame bytes
+
+Topic-mode servers publish [topic, body]; both frames are kept. read_records()
+iterates a segment back.
+
+    python monitor_zmq.py --record recordings/
+"""
+
+import logging
+import mmap
+import os
+import struct
+import time
+
+import zmq
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_MAGIC = b"AQREC1\n"
+SEGMENT_SUFFIX = ".aqrec"
+RECORD_HEADER = struct.Struct("<qH")
+FRAME_LENGTH = struct.Struct("<I")
+
+class TrafficRecorder:
+    """
+    Appends messages to rotating segment files named
+    <prefix>-<start time>-<sequence>.aqrec in directory. Writes go through a
+    write_buffer-sized buffer and reach the disk at least every flush_interval
+    seconds (when recording) or when a segment is rotated or closed.
+    """
+    MAX_BATCH = 1000 # Messages written per poll wake-up, between stop and flush checks
+
+    def __init__(self, directory, prefix="acquila", segment_bytes=64 * 1024 * 1024, write_buffer=1024 * 1024,
+                 flush_interval=0.5):
+        self.directory = directory
+        self.prefix = prefix
+        self.segment_bytes = segment_bytes
+        self.write_buffer = write_buffer
+        self.flush_interval = flush_interval
+        self.file = None
+        self.path = None
+        self.segment_size = 0
+        self.sequence = 0
+        self.recorded = 0
+        self.running = False
+        os.makedirs(directory, exist_ok=True)
+
+    def _open_segment(self):
+        if self.file is not None:
+            self.file.close()
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        while True:
+            self.sequence += 1
+            path = os.path.join(self.directory, f"{self.prefix}-{stamp}-{self.sequence:04d}{SEGMENT_SUFFIX}")
+            try:
+                # "xb" fails rather than truncate a segment that already exists
+                self.file = open(path, "xb", buffering=self.write_buffer)
+                break
+            except FileExistsError:
+                continue
+        self.file.write(SEGMENT_MAGIC)
+        self.path = path
+        self.segment_size = len(SEGMENT_MAGIC)
+        logger.info("[RECORDER] Writing %s", path)
+
+    def write(self, frames, t_ns=None):
+        """Appends one message (a list of bytes-like frames)."""
+        if self.file is None or self.segment_size >= self.segment_bytes:
+            self._open_segment()
+        parts = [RECORD_HEADER.pack(time.time_ns() if t_ns is None else t_ns, len(frames))]
+        size = RECORD_HEADER.size
+        for frame in frames:
+            parts.append(FRAME_LENGTH.pack(len(frame)))
+            parts.append(frame)
+            size += FRAME_LENGTH.size + len(frame)
+        self.file.write(b"".join(parts))
+        self.segment_size += size
+        self.recorded += 1
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def record(self, endpoint="tcp://127.0.0.1:5555", context=None, max_messages=None):
+        """
+        Subscribes to endpoint and records until stop() is called (from another
+        thread), max_messages have been written or Ctrl-C. The receive queue has
+        no high-water mark, so bursts are queued rather than dropped.
+        """
+        context = context or zmq.Context.instance()
+        socket = context.socket(zmq.SUB)
+        socket.setsockopt(zmq.RCVHWM, 0)
+        socket.connect(endpoint)
+        socket.setsockopt(zmq.SUBSCRIBE, b"")
+        poller = zmq.Poller()
+        poller.register(socket, zmq.POLLIN)
+        logger.info("[RECORDER] Recording %s into %s", endpoint, self.directory)
+
+        self.running = True
+        next_flush = time.monotonic() + self.flush_interval
+        try:
+            while self.running:
+                # Block until traffic arrives (or a flush is due), then drain up to a batch
+                if poller.poll(timeout=max(0, int((next_flush - time.monotonic()) * 1000))):
+                    try:
+                        for _ in range(self.MAX_BATCH):
+                            frames = socket.recv_multipart(flags=zmq.NOBLOCK)
+                            self.write(frames)
+                            if max_messages is not None and self.recorded >= max_messages:
+                                self.running = False
+                                break
+                    except zmq.Again:
+                        pass
+                if time.monotonic() >= next_flush:
+                    self.flush()
+                    next_flush = time.monotonic() + self.flush_interval
+        except KeyboardInterrupt:
+            logger.info("[RECORDER] Stop requested (Ctrl-C).")
+        finally:
+            self.running = False
+            socket.close(linger=0)
+            self.close()
+            logger.info("[RECORDER] Recorded %d messages.", self.recorded)
+
+    def stop(self):
+        self.running = False
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+def read_record(buf, pos):
+    """
+    Parses the record starting at pos in a segment's bytes (or mmap). Returns
+    (receive time in ns, [frames], position of the next record), or None when
+    the record is incomplete (end of data, or a recorder killed mid-write).
+    """
+    try:
+        t_ns, count = RECORD_HEADER.unpack_from(buf, pos)
+        pos += RECORD_HEADER.size
+        frames = []
+        for _ in range(count):
+            (length,) = FRAME_LENGTH.unpack_from(buf, pos)
+            pos += FRAME_LENGTH.size
+            if pos + length > len(buf):
+                return None
+            frames.append(buf[pos:pos + length])
+            pos += length
+    except struct.error:
+        return None
+    return t_ns, frames, pos
+
+def read_records(path, start=None):
+    """Yields (offset, receive time in ns, [frames]) for every record in a segment file."""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        if buf[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+            raise ValueError(f"{path} is not an Acquila traffic recording")
+        pos = len(SEGMENT_MAGIC) if start is None else start
+        while True:
+            record = read_record(buf, pos)
+            if record is None:
+                return
+            t_ns, frames, next_pos = record
+            yield pos, t_ns, frames
+            pos = next_pos
+
+def segment_paths(directory, prefix="acquila"):
+    """Segment files of a recording directory in recording order."""
+    names = sorted(n for n in os.listdir(directory) if n.startswith(prefix + "-") and n.endswith(SEGMENT_SUFFIX))
+    return [os.path.join(directory, n) for n in names]
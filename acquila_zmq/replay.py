@@ -0,0 +1,285 @@
+"""
+Querying and replaying traffic recorded by TrafficRecorder.
+
+RecordingIndex keeps a sqlite sidecar (index.sqlite in the recording
+directory) mapping every message's UUID, component, reply type and receive
+time to its segment and byte offset. Queries go through the sqlite indexes and
+read only the matching records from the memory-mapped segments. Indexing is
+incremental: update() continues where the last run stopped, so it can be
+re-run while a recorder is still appending. A topic-mode server publishes each
+SENT under every name of its component and to the sender; only one copy is
+indexed, so lifecycles show it once and replay sends each command once.
+
+    python -m acquila_zmq.replay recordings/ lifecycle 3f2a...
+    python -m acquila_zmq.replay recordings/ query --component motor_X --type ERR --since 2025-03-01T10:00
+    python -m acquila_zmq.replay recordings/ replay --speed 10 --endpoint tcp://127.0.0.1:5556
+"""
+
+import argparse
+import datetime
+import logging
+import mmap
+import os
+import sqlite3
+import time
+
+import zmq
+
+from . import DEFAULT_INBOUND_PORT, _OTHER_TOPIC, _component_topic
+from .codec import CodecError, decode_payload
+from .recorder import SEGMENT_MAGIC, read_record, segment_paths
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "index.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    indexed_to INTEGER NOT NULL            -- byte offset up to which records are indexed
+);
+CREATE TABLE IF NOT EXISTS records (
+    segment INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    t_ns INTEGER NOT NULL,
+    uuid TEXT,
+    component TEXT,
+    comp_phys TEXT,
+    reply_type TEXT
+);
+CREATE INDEX IF NOT EXISTS records_uuid ON records (uuid);
+CREATE INDEX IF NOT EXISTS records_component ON records (component, reply_type, t_ns);
+CREATE INDEX IF NOT EXISTS records_comp_phys ON records (comp_phys, reply_type, t_ns);
+CREATE INDEX IF NOT EXISTS records_time ON records (t_ns);
+"""
+
+class RecordingIndex:
+    """
+    Sidecar index over a recording directory. Query results are lists of
+    (receive time in ns, decoded payload) in time order; payloads that were not
+    Acquila messages come back as {"raw": text}.
+    """
+    def __init__(self, directory, prefix="acquila"):
+        self.directory = directory
+        self.prefix = prefix
+        self.db = sqlite3.connect(os.path.join(directory, INDEX_NAME))
+        self.db.executescript(_SCHEMA)
+        self.maps = {} # segment id -> (file, mmap)
+
+    def update(self):
+        """Indexes whatever was recorded since the last update; returns the number of new records."""
+        added = 0
+        for path in segment_paths(self.directory, self.prefix):
+            name = os.path.basename(path)
+            row = self.db.execute("SELECT id, indexed_to FROM segments WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                segment_id = self.db.execute("INSERT INTO segments (name, indexed_to) VALUES (?, ?)",
+                                             (name, len(SEGMENT_MAGIC))).lastrowid
+                pos = len(SEGMENT_MAGIC)
+            else:
+                segment_id, pos = row
+            if os.path.getsize(path) <= pos:
+                continue
+
+            rows = []
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                while True:
+                    record = read_record(buf, pos)
+                    if record is None:
+                        break
+                    t_ns, frames, next_pos = record
+                    data = _decode(frames[-1]) if frames else {}
+                    if _is_extra_copy(frames, data):
+                        pos = next_pos
+                        continue
+                    rows.append((segment_id, pos, t_ns, data.get("UUID"), data.get("component"),
+                                 data.get("comp_phys"), data.get("reply type")))
+                    pos = next_pos
+            with self.db:
+                self.db.executemany("INSERT INTO records VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                self.db.execute("UPDATE segments SET indexed_to = ? WHERE id = ?", (pos, segment_id))
+            self._unmap(segment_id) # The file has grown since it was mapped
+            added += len(rows)
+        self.db.commit()
+        if added:
+            logger.info("[REPLAY] Indexed %d new records in %s", added, self.directory)
+        return added
+
+    def lifecycle(self, uuid_val):
+        """Every recorded message of one command (SENT, RCV, FDB..., ACK/ERR) in time order."""
+        return self._fetch("SELECT segment, offset, t_ns FROM records WHERE uuid = ? ORDER BY t_ns", (uuid_val,))
+
+    def query(self, component=None, reply_type=None, since=None, until=None, limit=None):
+        """
+        Messages matching every given filter. component matches the abstract or
+        physical name; since/until are datetimes or epoch seconds.
+        """
+        return self._fetch(*self._select(component, reply_type, since, until, limit))
+
+    def frames(self, since=None, until=None):
+        """Yields (receive time in ns, [frames]) for every recorded message in time order."""
+        for segment_id, offset, t_ns in self.db.execute(*self._select(since=since, until=until)):
+            yield t_ns, self._read(segment_id, offset)[1]
+
+    @staticmethod
+    def _select(component=None, reply_type=None, since=None, until=None, limit=None):
+        clauses, params = [], []
+        if component is not None:
+            clauses.append("(component = ? OR comp_phys = ?)")
+            params += [component, component]
+        if reply_type is not None:
+            clauses.append("reply_type = ?")
+            params.append(reply_type)
+        if since is not None:
+            clauses.append("t_ns >= ?")
+            params.append(_to_ns(since))
+        if until is not None:
+            clauses.append("t_ns <= ?")
+            params.append(_to_ns(until))
+        sql = "SELECT segment, offset, t_ns FROM records"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY t_ns"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return sql, params
+
+    def _fetch(self, sql, params):
+        results = []
+        for segment_id, offset, t_ns in self.db.execute(sql, params).fetchall():
+            frames = self._read(segment_id, offset)[1]
+            results.append((t_ns, _decode(frames[-1]) if frames else {}))
+        return results
+
+    def _read(self, segment_id, offset):
+        mapped = self.maps.get(segment_id)
+        if mapped is None:
+            (name,) = self.db.execute("SELECT name FROM segments WHERE id = ?", (segment_id,)).fetchone()
+            f = open(os.path.join(self.directory, name), "rb")
+            mapped = self.maps[segment_id] = (f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        t_ns, frames, _ = read_record(mapped[1], offset)
+        return t_ns, frames
+
+    def _unmap(self, segment_id):
+        mapped = self.maps.pop(segment_id, None)
+        if mapped is not None:
+            mapped[1].close()
+            mapped[0].close()
+
+    def close(self):
+        for segment_id in list(self.maps):
+            self._unmap(segment_id)
+        self.db.close()
+
+def replay(index, endpoint=f"tcp://127.0.0.1:{DEFAULT_INBOUND_PORT}", speed=1.0, since=None, until=None,
+           context=None, connect_grace_s=0.5):
+    """
+    Publishes the recorded messages into a server's inbound socket. speed=1
+    keeps the original timing, speed=10 plays ten times faster and speed=0 sends
+    as fast as possible. Only the payload frame is sent, so the server handles
+    each message as if a (non topic-mode) client had sent it. Returns the number
+    of messages sent.
+    """
+    context = context or zmq.Context.instance()
+    socket = context.socket(zmq.PUB)
+    socket.setsockopt(zmq.SNDHWM, 0) # Queue rather than drop when the server falls behind
+    socket.connect(endpoint)
+    time.sleep(connect_grace_s) # A fresh PUB connection drops what it sends before it is up
+
+    sent = 0
+    first_ns = None
+    start = time.monotonic()
+    try:
+        for t_ns, frames in index.frames(since, until):
+            if speed:
+                first_ns = t_ns if first_ns is None else first_ns
+                delay = (t_ns - first_ns) / 1e9 / speed - (time.monotonic() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            socket.send(frames[-1])
+            sent += 1
+    finally:
+        socket.close(linger=-1)
+    logger.info("[REPLAY] Replayed %d messages in %.2f s", sent, time.monotonic() - start)
+    return sent
+
+def _is_extra_copy(frames, data):
+    """
+    True for the copies of a topic-mode SENT that are not on its first
+    component topic: the one on the other name of the component and the one
+    echoed to the sender's reply topic.
+    """
+    if data.get("reply type") != "SENT" or len(frames) < 2:
+        return False
+    topic = bytes(frames[0])
+    if not (topic.startswith((b"C/", b"R/", b"X/")) and topic.endswith(b"/")):
+        return False # Not a topic-mode recording: frames[0] is an attachment
+    name = data.get("component") or data.get("comp_phys")
+    return topic != (_component_topic(name) if name else _OTHER_TOPIC)
+
+def _decode(body):
+    try:
+        return decode_payload(body)
+    except CodecError:
+        return {"raw": bytes(body).decode("utf-8", errors="replace")}
+
+def _to_ns(value):
+    if isinstance(value, datetime.datetime):
+        value = value.timestamp()
+    return int(float(value) * 1e9)
+
+def _parse_time(text):
+    """Epoch seconds or an ISO date/time (local time)."""
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.datetime.fromisoformat(text).timestamp()
+
+def _format_ns(t_ns):
+    return datetime.datetime.fromtimestamp(t_ns / 1e9).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query or replay traffic recorded with monitor_zmq.py --record.")
+    parser.add_argument("directory", help="recording directory")
+    commands = parser.add_subparsers(dest="action", required=True)
+    commands.add_parser("index", help="index new recordings")
+    lifecycle = commands.add_parser("lifecycle", help="all messages of one command UUID")
+    lifecycle.add_argument("uuid")
+    query = commands.add_parser("query", help="messages by component, reply type and time")
+    query.add_argument("--component")
+    query.add_argument("--type", dest="reply_type")
+    query.add_argument("--since", type=_parse_time, help="epoch seconds or ISO time")
+    query.add_argument("--until", type=_parse_time, help="epoch seconds or ISO time")
+    query.add_argument("--limit", type=int)
+    play = commands.add_parser("replay", help="publish the recording into a server")
+    play.add_argument("--endpoint", default=f"tcp://127.0.0.1:{DEFAULT_INBOUND_PORT}", help="server inbound endpoint")
+    play.add_argument("--speed", type=float, default=1.0, help="1 = original timing, 0 = as fast as possible")
+    play.add_argument("--since", type=_parse_time)
+    play.add_argument("--until", type=_parse_time)
+    args = parser.parse_args(argv)
+
+    index = RecordingIndex(args.directory)
+    try:
+        added = index.update()
+        if args.action == "index":
+            print(f"Indexed {added} new records.")
+        elif args.action == "replay":
+            sent = replay(index, args.endpoint, args.speed, args.since, args.until)
+            print(f"Replayed {sent} messages.")
+        else:
+            if args.action == "lifecycle":
+                results = index.lifecycle(args.uuid)
+            else:
+                results = index.query(args.component, args.reply_type, args.since, args.until, args.limit)
+            for t_ns, data in results:
+                if "raw" in data:
+                    print(f"{_format_ns(t_ns)} RAW  {data['raw']}")
+                    continue
+                print(f"{_format_ns(t_ns)} {data.get('reply type', ''):<4} {data.get('component', '')} "
+                      f"{data.get('command', '')} {data.get('reply', '')} [{data.get('UUID', '')}]")
+    finally:
+        index.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""
+Sharded Acquila buses.
+
+One AcquilaServer decodes, tracks and relays every message on a single thread.
+Several servers ("shards") can split the load by component group, for example
+one for the motion group and one for the detector group, each in its own
+process:
+
+    {
+      "shards": {
+        "motion":   {"outbound": "tcp://127.0.0.1:6000", "inbound": "tcp://127.0.0.1:6001",
+                     "components": ["motor_*", "stage"]},
+        "detector": {"outbound": "tcp://127.0.0.1:6010", "inbound": "tcp://127.0.0.1:6011",
+                     "components": ["detector*"]}
+      },
+      "default": "motion"
+    }
+
+    python -m acquila_zmq.shard shards.json directory     # serves the map on DEFAULT_DIRECTORY_PORT
+    python -m acquila_zmq.shard shards.json serve motion
+    python -m acquila_zmq.shard shards.json serve detector
+
+A component lives on the first shard whose patterns (fnmatch style) match its
+name, else on the default shard. Commands, replies and feedback of a
+component therefore stay on one shard. ShardedClient fetches the map from the
+ShardDirectory once and keeps one AcquilaClient per shard it talks to.
+FederatedView follows every shard's outbound traffic and keeps one
+command_queue and one set of latency statistics for the whole bus.
+"""
+
+import argparse
+import fnmatch
+import json
+import logging
+import threading
+
+import zmq
+
+from . import AcquilaClient, AcquilaServer, configure_logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIRECTORY_PORT = 5550
+
+class ShardMap:
+    """Shard endpoints and the component patterns assigned to each shard."""
+    def __init__(self, shards, default=None):
+        self.shards = {name: dict(info) for name, info in shards.items()}
+        self.default = default
+        if default is not None and default not in self.shards:
+            raise ValueError(f"Default shard '{default}' is not defined")
+
+    @classmethod
+    def from_dict(cls, config):
+        return cls(config["shards"], config.get("default"))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+    def to_dict(self):
+        return {"shards": self.shards, "default": self.default}
+
+    def shard_for(self, component):
+        """Name of the shard serving component; KeyError if no pattern matches and there is no default."""
+        for name, info in self.shards.items():
+            if any(fnmatch.fnmatchcase(component, pattern) for pattern in info.get("components", ())):
+                return name
+        if self.default is None:
+            raise KeyError(f"No shard serves component '{component}'")
+        return self.default
+
+    def register(self, name, outbound, inbound, components=()):
+        self.shards[name] = {"outbound": outbound, "inbound": inbound, "components": list(components)}
+
+class ShardDirectory:
+    """
+    Serves a ShardMap over a REP socket. Requests and replies are JSON objects:
+
+        {"op": "map"}                                     -> the whole map
+        {"op": "lookup", "component": "motor_X"}          -> {"shard": ..., "outbound": ..., "inbound": ...}
+        {"op": "register", "shard": ..., "outbound": ..., "inbound": ..., "components": [...]}
+
+    Clients ask once and cache the map, so the directory is off the command path.
+    """
+    def __init__(self, shard_map, endpoint=DEFAULT_DIRECTORY_PORT, context=None):
+        self.shard_map = shard_map
+        self.endpoint = endpoint if isinstance(endpoint, str) else f"tcp://*:{endpoint}"
+        self.context = context or zmq.Context.instance()
+        self.running = False
+        self.lock = threading.Lock()
+
+    def handle(self, request):
+        if not isinstance(request, dict):
+            raise ValueError("Directory requests must be JSON objects")
+        op = request.get("op")
+        with self.lock:
+            if op == "map":
+                return self.shard_map.to_dict()
+            if op == "lookup":
+                name = self.shard_map.shard_for(_field(request, "component"))
+                return dict(self.shard_map.shards[name], shard=name)
+            if op == "register":
+                components = request.get("components", [])
+                if not isinstance(components, list) or not all(isinstance(c, str) for c in components):
+                    raise ValueError("Field 'components' must be a list of strings")
+                shard = _field(request, "shard")
+                self.shard_map.register(shard, _field(request, "outbound"), _field(request, "inbound"), components)
+                logger.info("[DIRECTORY] Registered shard %s", shard)
+                return {"ok": True}
+        raise ValueError(f"Unknown directory request '{op}'")
+
+    def start(self):
+        """Answers requests until stop() is called."""
+        socket = self.context.socket(zmq.REP)
+        socket.bind(self.endpoint)
+        logger.info("[DIRECTORY] Serving %d shards on %s", len(self.shard_map.shards), self.endpoint)
+        self.running = True
+        try:
+            while self.running:
+                if not socket.poll(100):
+                    continue
+                try:
+                    reply = self.handle(json.loads(socket.recv()))
+                except KeyError as e: # No shard for the component
+                    reply = {"error": e.args[0]}
+                except Exception as e: # A REP socket must answer every request, or its client hangs
+                    reply = {"error": str(e)}
+                socket.send(json.dumps(reply).encode("utf-8"))
+        finally:
+            socket.close(linger=0)
+
+    def stop(self):
+        self.running = False
+
+def _field(request, name):
+    value = request.get(name)
+    if value is None:
+        raise ValueError(f"Missing field '{name}'")
+    if not isinstance(value, str):
+        raise ValueError(f"Field '{name}' must be a string")
+    return value
+
+def directory_request(request, directory=f"tcp://127.0.0.1:{DEFAULT_DIRECTORY_PORT}", timeout_ms=2000,
+                      context=None):
+    """One request to a ShardDirectory; raises TimeoutError if it does not answer, ValueError on an error reply."""
+    socket = (context or zmq.Context.instance()).socket(zmq.REQ)
+    socket.connect(directory)
+    try:
+        socket.send(json.dumps(request).encode("utf-8"))
+        if not socket.poll(timeout_ms):
+            raise TimeoutError(f"No answer from the shard directory at {directory}")
+        reply = json.loads(socket.recv())
+    finally:
+        socket.close(linger=0)
+    if "error" in reply:
+        raise ValueError(reply["error"])
+    return reply
+
+class ShardedClient:
+    """
+    Routes every call to the client of the shard serving the component:
+
+        client = ShardedClient("tcp://directory-host:5550")
+        client.send_command("motor_X", "move_abs", arg1="10")     # motion shard
+        client.send_command("detector", "trigger")                # detector shard
+
+    shard_map (a ShardMap or its dict form) can be given instead of a directory.
+    A component no shard serves makes the client fetch the map again, in case
+    a shard registered since.
+    client_options (topics, codec, ...) are passed to every AcquilaClient.
+    Commands in one send_batch must all go to one shard; use client_for() to
+    reach a shard's AcquilaClient directly.
+    """
+    def __init__(self, directory=f"tcp://127.0.0.1:{DEFAULT_DIRECTORY_PORT}", shard_map=None, **client_options):
+        self.directory = directory if shard_map is None else None
+        if shard_map is None:
+            shard_map = ShardMap.from_dict(directory_request({"op": "map"}, directory))
+        elif isinstance(shard_map, dict):
+            shard_map = ShardMap.from_dict(shard_map)
+        self.shard_map = shard_map
+        self.client_options = client_options
+        self.clients = {} # shard name -> AcquilaClient
+        self.lock = threading.Lock()
+
+    def client_for(self, component):
+        try:
+            name = self.shard_map.shard_for(component)
+        except KeyError:
+            if self.directory is None:
+                raise
+            self.shard_map = ShardMap.from_dict(directory_request({"op": "map"}, self.directory))
+            name = self.shard_map.shard_for(component)
+        with self.lock:
+            client = self.clients.get(name)
+            if client is None:
+                info = self.shard_map.shards[name]
+                client = self.clients[name] = AcquilaClient(
+                    outbound_port=info["outbound"], inbound_port=info["inbound"], **self.client_options)
+        return client
+
+    def send_command(self, component, command, *args, **kwargs):
+        return self.client_for(component).send_command(component, command, *args, **kwargs)
+
+    def send_command_until(self, component, command, *args, **kwargs):
+        return self.client_for(component).send_command_until(component, command, *args, **kwargs)
+
+    def iter_feedback(self, component, command, *args, **kwargs):
+        return self.client_for(component).iter_feedback(component, command, *args, **kwargs)
+
+    def send_batch(self, commands, *args, **kwargs):
+        commands = list(commands)
+        shards = {self.shard_map.shard_for(step["component"]) for step in commands}
+        if len(shards) > 1:
+            raise ValueError(f"send_batch commands span several shards: {sorted(shards)}")
+        if not commands:
+            return iter(())
+        return self.client_for(commands[0]["component"]).send_batch(commands, *args, **kwargs)
+
+    def listen_and_process(self, physical_name, callback_function, **kwargs):
+        return self.client_for(physical_name).listen_and_process(physical_name, callback_function, **kwargs)
+
+    def close(self):
+        with self.lock:
+            clients, self.clients = self.clients, {}
+        for client in clients.values():
+            client.close()
+
+class FederatedView(AcquilaServer):
+    """
+    A read-only AcquilaServer fed by the outbound traffic of several shards
+    instead of by clients, so command_queue, snapshot() and latency_stats()
+    cover the whole bus. It binds nothing and relays nothing; run start() on a
+    thread like a server:
+
+        view = FederatedView([info["outbound"] for info in shard_map.shards.values()])
+        threading.Thread(target=view.start, daemon=True).start()
+    """
+    def __init__(self, outbound_endpoints, context=None, **options):
+        super().__init__(context=context, **options)
+        self.outbound_endpoints = list(outbound_endpoints)
+
+    def _setup_sockets(self):
+        self.socket_in = self.context.socket(zmq.SUB)
+        for endpoint in self.outbound_endpoints:
+            self.socket_in.connect(endpoint)
+        self.socket_in.setsockopt_string(zmq.SUBSCRIBE, "")
+        logger.info("[VIEW] Following %d shards", len(self.outbound_endpoints))
+
+    # Only the body matters: leading frames are shard topics, not client origins
+    def _handle(self, frames):
+        super()._handle(frames[-1:])
+
+    def _handle_fast(self, frames):
+        super()._handle_fast(frames[-1:])
+
+    def _relay(self, body, r_type, data, reply_origin, attachments=()):
+        pass
+
+def _bind_address(endpoint):
+    """tcp://host:port as given to clients -> tcp://*:port for the server; other transports unchanged."""
+    if endpoint.startswith("tcp://"):
+        return "tcp://*:" + endpoint.rsplit(":", 1)[1]
+    return endpoint
+
+def serve_shard(shard_map, name, directory=None, **server_options):
+    """Runs the AcquilaServer of one shard (blocking), first registering it with directory if given."""
+    info = shard_map.shards[name]
+    if directory:
+        directory_request(dict(info, op="register", shard=name), directory)
+    server = AcquilaServer(outbound_port=_bind_address(info["outbound"]), inbound_port=_bind_address(info["inbound"]),
+                           **server_options)
+    logger.info("[SHARD] %s serving %s", name, ", ".join(info.get("components", ())) or "(default)")
+    server.start()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the shard directory or one shard of a sharded Acquila bus.")
+    parser.add_argument("config", help="JSON shard map")
+    commands = parser.add_subparsers(dest="action", required=True)
+    directory = commands.add_parser("directory", help="serve the shard map to clients")
+    directory.add_argument("--endpoint", default=f"tcp://*:{DEFAULT_DIRECTORY_PORT}")
+    serve = commands.add_parser("serve", help="run the server of one shard")
+    serve.add_argument("shard")
+    serve.add_argument("--topics", action="store_true")
+    serve.add_argument("--fast-relay", action="store_true")
+    serve.add_argument("--directory", help="register this shard with the directory at this endpoint")
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    shard_map = ShardMap.load(args.config)
+    if args.action == "directory":
+        ShardDirectory(shard_map, args.endpoint).start()
+    else:
+        serve_shard(shard_map, args.shard, args.directory, topics=args.topics, fast_relay=args.fast_relay)
+
+if __name__ == "__main__":
+    main()
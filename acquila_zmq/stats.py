@@ -0,0 +1,154 @@
+"""
+Command latency statistics for AcquilaServer.
+
+The server sees every command's SENT, RCV and ACK/ERR, and feeds the gaps into
+streaming histograms per component and command:
+
+    queue      SENT -> RCV      time until the component picked the command up
+    execution  RCV -> ACK/ERR   time the component spent on it
+    total      SENT -> ACK/ERR
+
+LatencyHistogram is log-linear like an HDR histogram: each power of two of
+microseconds is split into SUB_BUCKETS linear buckets, so any recorded value is
+reported within about 1/SUB_BUCKETS of its true value while memory stays a few
+hundred counters however many values are recorded.
+"""
+
+import threading
+
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS # 16 per power of two: ~6% worst-case error
+
+class LatencyHistogram:
+    """Counts of durations (recorded in seconds, stored as microseconds)."""
+    def __init__(self):
+        self.counts = {} # bucket index -> count
+        self.count = 0
+        self.total_us = 0
+        self.min_us = None
+        self.max_us = 0
+
+    @staticmethod
+    def _bucket(value_us):
+        if value_us < SUB_BUCKETS:
+            return value_us # Exact below SUB_BUCKETS us
+        shift = value_us.bit_length() - 1 - SUB_BUCKET_BITS
+        return ((shift + 1) << SUB_BUCKET_BITS) + ((value_us >> shift) - SUB_BUCKETS)
+
+    @staticmethod
+    def _bucket_upper_us(index):
+        """Largest value that falls into bucket index."""
+        if index < SUB_BUCKETS:
+            return index
+        shift = (index >> SUB_BUCKET_BITS) - 1
+        sub = index & (SUB_BUCKETS - 1)
+        return ((SUB_BUCKETS + sub + 1) << shift) - 1
+
+    def record(self, seconds):
+        value_us = max(0, int(seconds * 1e6))
+        index = self._bucket(value_us)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total_us += value_us
+        if self.min_us is None or value_us < self.min_us:
+            self.min_us = value_us
+        if value_us > self.max_us:
+            self.max_us = value_us
+
+    def percentile(self, pct):
+        """Value in seconds below which pct percent of the recorded values fall."""
+        if not self.count:
+            return None
+        rank = max(1, int(round(pct / 100.0 * self.count)))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._bucket_upper_us(index), self.max_us) / 1e6
+        return self.max_us / 1e6
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total_us += other.total_us
+        if other.min_us is not None and (self.min_us is None or other.min_us < self.min_us):
+            self.min_us = other.min_us
+        self.max_us = max(self.max_us, other.max_us)
+
+    def summary(self):
+        """count, mean, min, p50/p90/p99 and max in milliseconds."""
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_ms": self.total_us / self.count / 1000.0,
+            "min_ms": self.min_us / 1000.0,
+            "p50_ms": self.percentile(50) * 1000.0,
+            "p90_ms": self.percentile(90) * 1000.0,
+            "p99_ms": self.percentile(99) * 1000.0,
+            "max_ms": self.max_us / 1000.0,
+        }
+
+class LatencyStats:
+    """
+    Queue/execution/total histograms per (component, command). At most max_keys
+    pairs are tracked separately; commands beyond that are counted under
+    OTHER_KEY so memory stays bounded.
+
+    record_command() must be called with lock held; AcquilaServer
+    passes its own lock and records from inside its bookkeeping, so the relay
+    loop takes no extra lock. summary() and reset() take the lock themselves.
+    """
+    KINDS = ("queue", "execution", "total")
+    OTHER_KEY = ("*", "*")
+
+    def __init__(self, max_keys=1000, lock=None):
+        self.max_keys = max_keys
+        self.histograms = {} # (component, command) -> {kind: LatencyHistogram}
+        self.errors = {} # (component, command) -> ERR count
+        self.lock = lock or threading.Lock()
+
+    def _for(self, key):
+        histograms = self.histograms.get(key)
+        if histograms is None:
+            if len(self.histograms) >= self.max_keys:
+                key = self.OTHER_KEY
+                histograms = self.histograms.get(key)
+            if histograms is None:
+                histograms = self.histograms[key] = {kind: LatencyHistogram() for kind in self.KINDS}
+        return histograms
+
+    def record_command(self, component, command, sent_time, rcv_time, finish_time, error=False):
+        """Records one finished command from its SENT/RCV/ACK-or-ERR times; missing times are skipped."""
+        key = (component, command)
+        histograms = self.histograms.get(key) or self._for(key)
+        if sent_time is not None:
+            histograms["total"].record(finish_time - sent_time)
+            if rcv_time is not None:
+                histograms["queue"].record(rcv_time - sent_time)
+        if rcv_time is not None:
+            histograms["execution"].record(finish_time - rcv_time)
+        if error:
+            key = key if key in self.histograms else self.OTHER_KEY
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    def summary(self, component=None):
+        """
+        {"component/command": {"queue": {...}, "execution": {...}, "total": {...},
+        "errors": n}}, optionally for one component only.
+        """
+        with self.lock:
+            result = {}
+            for (comp, command), histograms in self.histograms.items():
+                if component is not None and comp != component:
+                    continue
+                entry = {kind: histogram.summary() for kind, histogram in histograms.items()}
+                entry["errors"] = self.errors.get((comp, command), 0)
+                result[f"{comp}/{command}"] = entry
+            return result
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.errors = {}
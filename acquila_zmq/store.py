@@ -0,0 +1,188 @@
+"""
+Bounded command bookkeeping for AcquilaServer.
+
+CommandStore is the server's command_queue: a dict of UUID -> command entry
+that indexes entries by component and status, and drops them again once they
+have been finished for finished_ttl seconds, have seen no traffic for
+stale_ttl seconds (commands that never got an ACK), or when more than
+max_entries are held. Memory use therefore stays flat however long the server
+runs.
+
+Every change bumps a version number, so readers can ask for just the entries
+that changed (and the UUIDs that were removed) since the version they last saw;
+see snapshot().
+
+The store is not thread-safe by itself; AcquilaServer guards it with its lock.
+"""
+
+import collections
+import collections.abc
+import time
+
+FINISHED = "FINISHED"
+
+CommandSnapshot = collections.namedtuple("CommandSnapshot", "version full changed removed")
+CommandSnapshot.__doc__ = """
+Result of CommandStore.snapshot(): changed maps UUID -> copy of the entry,
+removed lists UUIDs dropped since the requested version. full=True means
+changed holds every entry and the reader should discard what it had.
+"""
+
+class CommandStore(collections.abc.MutableMapping):
+    """
+    Dict-like store of command entries. Change an entry's status through
+    set_status() (not by assigning entry["status"]) so the indexes stay right.
+
+        with server.lock:
+            running = server.command_queue.with_status("RUNNING")
+            motor = server.command_queue.for_component("motor_X")
+    """
+    def __init__(self, max_entries=100000, finished_ttl=10.0, stale_ttl=3600.0, max_tombstones=None):
+        self.max_entries = max_entries
+        self.finished_ttl = finished_ttl
+        self.stale_ttl = stale_ttl
+        self.entries = {}
+        # status -> OrderedDict of UUID -> monotonic time of the last change, oldest first
+        self.by_status = collections.defaultdict(collections.OrderedDict)
+        self.by_component = collections.defaultdict(set) # component/comp_phys name -> UUIDs
+        self.expired = 0 # Entries dropped by TTL
+        self.evicted = 0 # Entries dropped to stay within max_entries
+
+        self.version = 0 # Bumped on every visible change
+        self.changed = collections.OrderedDict() # UUID -> version of its last change, oldest first
+        self.tombstones = collections.OrderedDict() # Removed UUID -> version of the removal
+        self.max_tombstones = max_tombstones if max_tombstones is not None else max_entries
+        self.tombstone_floor = 0 # Readers older than this missed removals and need a full snapshot
+
+    def __getitem__(self, uuid_val):
+        return self.entries[uuid_val]
+
+    def __setitem__(self, uuid_val, entry):
+        if uuid_val in self.entries:
+            self._unindex(uuid_val)
+        self.entries[uuid_val] = entry
+        self._changed(uuid_val)
+        self.tombstones.pop(uuid_val, None)
+        self.by_status[entry.get("status")][uuid_val] = time.monotonic()
+        for name in self._names(entry):
+            self.by_component[name].add(uuid_val)
+        while len(self.entries) > self.max_entries:
+            self._evict_oldest()
+
+    def __delitem__(self, uuid_val):
+        self._unindex(uuid_val)
+        del self.entries[uuid_val]
+        del self.changed[uuid_val]
+        self.version += 1
+        self.tombstones[uuid_val] = self.version
+        if len(self.tombstones) > self.max_tombstones:
+            _, self.tombstone_floor = self.tombstones.popitem(last=False)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, uuid_val):
+        return uuid_val in self.entries
+
+    def get(self, uuid_val, default=None):
+        return self.entries.get(uuid_val, default)
+
+    def set_status(self, uuid_val, status, **fields):
+        """Moves an entry to a new status, updating any other fields given as keyword arguments."""
+        entry = self.entries[uuid_val]
+        self._status_index(entry, uuid_val).pop(uuid_val, None)
+        if fields:
+            entry.update(fields)
+        entry["status"] = status
+        self.by_status[status][uuid_val] = time.monotonic()
+        self._changed(uuid_val)
+
+    def touch(self, uuid_val):
+        """Marks an entry as active (e.g. on FDB) so it is not reaped as stale."""
+        entry = self.entries.get(uuid_val)
+        if entry is not None:
+            index = self._status_index(entry, uuid_val)
+            index[uuid_val] = time.monotonic()
+            index.move_to_end(uuid_val)
+
+    def snapshot(self, since_version=0):
+        """
+        Returns a CommandSnapshot of what changed after since_version (0 for
+        everything). The cost is proportional to the number of changes, not to
+        the size of the store. Pass the returned version on the next call.
+        """
+        if since_version <= 0 or since_version < self.tombstone_floor or since_version > self.version:
+            changed = {u: dict(e) for u, e in self.entries.items()}
+            return CommandSnapshot(self.version, True, changed, [])
+
+        changed = {}
+        for uuid_val in reversed(self.changed):
+            if self.changed[uuid_val] <= since_version:
+                break
+            changed[uuid_val] = dict(self.entries[uuid_val])
+        removed = []
+        for uuid_val in reversed(self.tombstones):
+            if self.tombstones[uuid_val] <= since_version:
+                break
+            removed.append(uuid_val)
+        return CommandSnapshot(self.version, False, changed, removed)
+
+    def with_status(self, status):
+        """Entries with the given status, least recently changed first."""
+        return [self.entries[u] for u in self.by_status.get(status, ())]
+
+    def for_component(self, name):
+        """Entries addressed to name, as component or comp_phys."""
+        return [self.entries[u] for u in self.by_component.get(name, ())]
+
+    def expire(self, now=None):
+        """Drops finished and stale entries whose TTL has passed; returns how many were dropped."""
+        now = time.monotonic() if now is None else now
+        dropped = 0
+        for status, index in list(self.by_status.items()):
+            ttl = self.finished_ttl if status == FINISHED else self.stale_ttl
+            while index:
+                uuid_val, changed = next(iter(index.items()))
+                if now - changed <= ttl:
+                    break
+                del self[uuid_val]
+                dropped += 1
+        self.expired += dropped
+        return dropped
+
+    def _evict_oldest(self):
+        # Finished commands go first; only then the longest-idle active one
+        candidates = self.by_status.get(FINISHED) or min(
+            (index for index in self.by_status.values() if index), key=lambda index: next(iter(index.values())))
+        del self[next(iter(candidates))]
+        self.evicted += 1
+
+    def _changed(self, uuid_val):
+        self.version += 1
+        self.changed[uuid_val] = self.version
+        self.changed.move_to_end(uuid_val)
+
+    def _status_index(self, entry, uuid_val):
+        index = self.by_status.get(entry.get("status"))
+        if index is None or uuid_val not in index:
+            # Status was assigned directly on the entry; find where it is indexed
+            index = next(i for i in self.by_status.values() if uuid_val in i)
+        return index
+
+    def _unindex(self, uuid_val):
+        entry = self.entries[uuid_val]
+        index = self._status_index(entry, uuid_val)
+        del index[uuid_val]
+        for name in self._names(entry):
+            uuids = self.by_component.get(name)
+            if uuids is not None:
+                uuids.discard(uuid_val)
+                if not uuids:
+                    del self.by_component[name]
+
+    @staticmethod
+    def _names(entry):
+        return {entry.get("component"), entry.get("comp_phys")} - {None, ""}
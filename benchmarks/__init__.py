@@ -0,0 +1,7 @@
+"""
+Benchmarks for the Acquila ZMQ library.
+
+Each module is runnable from the repository root, e.g.:
+
+    python -m benchmarks.bench_latency
+"""
@@ -0,0 +1,71 @@
+"""
+Large payload benchmark.
+
+Sends --size byte blobs (e.g. a preview frame) to an echo component through an
+in-process server, three ways: base64 text in arg1 (the only option before
+attachments), an attachment frame, and a SharedAttachment handle. The
+component reads every byte and replies with the length it saw. Reports the
+round trip per command and the effective bandwidth.
+
+    python -m benchmarks.bench_attach --size 4194304 --count 50
+"""
+import argparse
+import base64
+import os
+import threading
+import time
+
+from acquila_zmq import AcquilaClient, SharedAttachment, open_attachment
+from benchmarks.common import BENCH_INBOUND_PORT, BENCH_OUTBOUND_PORT, quiet, start_server, summarize_ms
+
+def bench_client(**kwargs):
+    return AcquilaClient(outbound_port=BENCH_OUTBOUND_PORT, inbound_port=BENCH_INBOUND_PORT, **kwargs)
+
+def measure(data):
+    if data.get("attachments"):
+        with open_attachment(data["attachments"][0]) as buf:
+            return sum(buf[::4096]) and len(buf)
+    blob = base64.b64decode(data["arg1"])
+    return sum(blob[::4096]) and len(blob)
+
+def run(client, count, send_one):
+    samples = []
+    for _ in range(count):
+        t0 = time.perf_counter()
+        reply = send_one()
+        assert reply is not None, "command timed out"
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=4 * 1024 * 1024)
+    parser.add_argument("--count", type=int, default=50)
+    parser.add_argument("--fast-relay", action="store_true")
+    args = parser.parse_args()
+
+    blob = os.urandom(args.size)
+    with quiet():
+        server = start_server(fast_relay=args.fast_relay)
+        component = bench_client()
+        threading.Thread(target=component.listen_and_process, args=("viewer", lambda c, d: measure(d)),
+                         daemon=True).start()
+        client = bench_client()
+        shared = SharedAttachment(blob)
+        modes = [
+            ("base64 arg1", lambda: client.send_command("viewer", "show", arg1=base64.b64encode(blob).decode("ascii"))),
+            ("attachment", lambda: client.send_command("viewer", "show", attachments=[blob])),
+            ("shared memory", lambda: client.send_command("viewer", "show", attachments=[shared])),
+        ]
+        results = [(name, run(client, args.count, send_one)) for name, send_one in modes]
+        shared.release()
+        server.stop()
+
+    print(f"{'mode':<15} {'p50 ms':>8} {'p99 ms':>8} {'MB/s':>8}")
+    for name, samples in results:
+        summary = summarize_ms(samples)
+        print(f"{name:<15} {summary['p50_ms']:>8.2f} {summary['p99_ms']:>8.2f} "
+              f"{args.size / (summary['p50_ms'] / 1000.0) / 1e6:>8.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Pipelined script benchmark.
+
+Runs a --steps step script against --motors motor components and one detector,
+each taking --delay ms per command. The script repeats "move every motor, then
+trigger the detector once all moves have ACKed" (a barrier). Compares the
+script runner's old step-by-step send_command loop with send_batch().
+
+    python -m benchmarks.bench_batch --steps 500 --delay 10
+"""
+import argparse
+import threading
+import time
+
+from acquila_zmq import AcquilaClient
+from benchmarks.common import BENCH_INBOUND_PORT, BENCH_OUTBOUND_PORT, quiet, start_server
+
+def make_script(steps, motors):
+    script = []
+    while len(script) < steps:
+        for m in range(motors):
+            script.append({"component": f"motor_{m}", "command": "move_abs", "arg1": str(len(script))})
+        script.append({"component": "detector", "command": "trigger", "barrier": True})
+    return script[:steps]
+
+def bench_client():
+    return AcquilaClient(outbound_port=BENCH_OUTBOUND_PORT, inbound_port=BENCH_INBOUND_PORT)
+
+def start_components(names, delay_s):
+    def work(client, data):
+        time.sleep(delay_s)
+        return "done"
+    for name in names:
+        client = bench_client()
+        # Several workers, so a component can overlap commands like a real multi-axis controller
+        threading.Thread(target=client.listen_and_process, args=(name, work), kwargs={"max_workers": 4},
+                         daemon=True).start()
+
+def run_sequential(client, script):
+    for step in script:
+        client.send_command(step["component"], step["command"], step.get("arg1", ""))
+
+def run_batch(client, script, max_in_flight):
+    for _ in client.send_batch(script, max_in_flight=max_in_flight):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", type=int, default=500)
+    parser.add_argument("--motors", type=int, default=4)
+    parser.add_argument("--delay", type=float, default=10.0, help="ms each command takes")
+    args = parser.parse_args()
+
+    script = make_script(args.steps, args.motors)
+    runs = [("send_command loop", lambda c: run_sequential(c, script))]
+    runs += [(f"send_batch x{n}", lambda c, n=n: run_batch(c, script, n)) for n in (1, 4, 16)]
+
+    print(f"{'mode':<20} {'seconds':>8} {'steps/s':>9}")
+    with quiet():
+        server = start_server()
+        start_components([f"motor_{m}" for m in range(args.motors)] + ["detector"], args.delay / 1000.0)
+        client = bench_client()
+        results = []
+        for name, run in runs:
+            t0 = time.perf_counter()
+            run(client)
+            results.append((name, time.perf_counter() - t0))
+        client.close()
+        server.stop()
+    for name, elapsed in results:
+        print(f"{name:<20} {elapsed:>8.2f} {len(script) / elapsed:>9,.0f}")
+
+if __name__ == "__main__":
+    main()
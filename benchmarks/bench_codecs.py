@@ -0,0 +1,56 @@
+"""
+Codec benchmark: messages/sec and bytes/message for each payload codec.
+
+Encodes and decodes a typical command payload (as built by AcquilaClient) with
+every available codec and reports encode, decode and combined round-trip rates.
+
+    python -m benchmarks.bench_codecs --count 200000
+"""
+import argparse
+import time
+
+from acquila_zmq import _create_payload
+from acquila_zmq.codec import decode_payload, get_codec
+
+CODEC_NAMES = ("json", "msgpack", "struct")
+
+def sample_payload():
+    return _create_payload("motor_X", "stage_1_motor_X", "move_abs", "12.500", "mm", "Position Reached", "ACK")
+
+def bench_codec(codec, payload, count):
+    t0 = time.perf_counter()
+    for _ in range(count):
+        buf = codec.encode(payload)
+    t_encode = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for _ in range(count):
+        decode_payload(buf)
+    t_decode = time.perf_counter() - t0
+
+    return {
+        "bytes_per_msg": len(buf),
+        "encode_msgs_per_s": count / t_encode,
+        "decode_msgs_per_s": count / t_decode,
+        "roundtrip_msgs_per_s": count / (t_encode + t_decode),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=200000, help="messages per codec")
+    args = parser.parse_args()
+
+    payload = sample_payload()
+    print(f"{'codec':<8} {'bytes':>6} {'encode/s':>12} {'decode/s':>12} {'enc+dec/s':>12}")
+    for name in CODEC_NAMES:
+        try:
+            codec = get_codec(name)
+        except ImportError as e:
+            print(f"{name:<8} skipped ({e})")
+            continue
+        r = bench_codec(codec, payload, args.count)
+        print(f"{name:<8} {r['bytes_per_msg']:>6} {r['encode_msgs_per_s']:>12,.0f} "
+              f"{r['decode_msgs_per_s']:>12,.0f} {r['roundtrip_msgs_per_s']:>12,.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Feedback streaming benchmark.
+
+A component sends --rate FDB progress messages per second for --seconds, each
+carrying its send time, while the consumer spends --work ms on every message it
+reads through iter_feedback. Reports how many FDBs were read, how stale the
+progress was when read, and how long after the ACK the consumer caught up, for
+an unbounded buffer and for keep-latest buffers.
+
+    python -m benchmarks.bench_feedback --rate 1000 --work 10
+"""
+import argparse
+import threading
+import time
+
+from acquila_zmq import AcquilaClient
+from benchmarks.common import BENCH_INBOUND_PORT, BENCH_OUTBOUND_PORT, quiet, start_server, summarize_ms
+
+def bench_client():
+    return AcquilaClient(outbound_port=BENCH_OUTBOUND_PORT, inbound_port=BENCH_INBOUND_PORT)
+
+def start_reporter(rate, seconds):
+    def progress(client, data):
+        interval = 1.0 / rate
+        next_time = time.perf_counter()
+        for _ in range(int(rate * seconds)):
+            client.send_feedback(data, repr(time.perf_counter()))
+            next_time += interval
+            time.sleep(max(0.0, next_time - time.perf_counter()))
+        return repr(time.perf_counter())
+    client = bench_client()
+    threading.Thread(target=client.listen_and_process, args=("recon", progress), daemon=True).start()
+
+def consume(client, max_buffer, work_s):
+    staleness = []
+    for msg in client.iter_feedback("recon", "start_recon", timeout_ms=None, max_buffer=max_buffer):
+        if msg["reply type"] != "FDB":
+            return staleness, time.perf_counter() - float(msg["reply"])
+        staleness.append(time.perf_counter() - float(msg["reply"]))
+        time.sleep(work_s)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=1000.0, help="FDB per second")
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--work", type=float, default=10.0, help="ms the consumer spends per FDB")
+    args = parser.parse_args()
+
+    print(f"{'max_buffer':<11} {'read':>7} {'p50 stale ms':>13} {'max stale ms':>13} {'done after ACK ms':>18}")
+    with quiet():
+        server = start_server()
+        start_reporter(args.rate, args.seconds)
+        client = bench_client()
+        results = [(max_buffer, consume(client, max_buffer, args.work / 1000.0)) for max_buffer in (None, 16, 1)]
+        client.close()
+        server.stop()
+    for max_buffer, (staleness, after_ack) in results:
+        stale = summarize_ms(staleness)
+        print(f"{str(max_buffer):<11} {stale['count']:>7,} {stale['p50_ms']:>13.1f} {stale['max_ms']:>13.1f} "
+              f"{after_ack * 1000:>18.1f}")
+
+if __name__ == "__main__":
+    main()
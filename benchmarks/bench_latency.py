@@ -0,0 +1,99 @@
+"""
+Round-trip latency microbenchmark for AcquilaClient.send_command.
+
+Sends commands to an echo component through an in-process AcquilaServer and
+reports SENT -> ACK round-trip percentiles for:
+
+  * legacy: the original receive loop (recv_string NOBLOCK + 10 ms sleep on zmq.Again)
+  * event:  the current client, whose waiters are woken by the receiver thread
+
+    python -m benchmarks.bench_latency --count 500
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+
+import zmq
+
+from acquila_zmq import AcquilaClient
+from benchmarks.common import BENCH_INBOUND_PORT, BENCH_OUTBOUND_PORT, quiet, start_server, summarize_ms
+
+def echo_logic(client, command_data):
+    return command_data.get("arg1")
+
+def legacy_send_command(socket_send, socket_recv, component, command, timeout_ms=10000):
+    """The pre-receiver-thread send_command loop, kept verbatim minus the prints."""
+    my_uuid = str(uuid.uuid4())
+    payload = {
+        "component": component, "comp_phys": "", "command": command, "arg1": "", "arg2": "",
+        "reply": "", "reply type": "SENT", "comp_type": "python_client",
+        "tick count": int(time.time() * 1000), "UUID": my_uuid,
+    }
+    socket_send.send_string(json.dumps(payload))
+
+    start_time = time.time() * 1000
+    while (time.time() * 1000 - start_time) < timeout_ms:
+        try:
+            rec_json = json.loads(socket_recv.recv_string(flags=zmq.NOBLOCK))
+            if rec_json.get("UUID") == my_uuid and rec_json.get("reply type") == "ACK":
+                return rec_json
+        except zmq.Again:
+            time.sleep(0.01)
+    return None
+
+def bench_legacy(count, outbound_port, inbound_port):
+    context = zmq.Context()
+    socket_send = context.socket(zmq.PUB)
+    socket_send.connect(f"tcp://127.0.0.1:{inbound_port}")
+    socket_recv = context.socket(zmq.SUB)
+    socket_recv.connect(f"tcp://127.0.0.1:{outbound_port}")
+    socket_recv.setsockopt_string(zmq.SUBSCRIBE, "")
+    time.sleep(1.0)
+
+    samples = []
+    for _ in range(count):
+        t0 = time.perf_counter()
+        if legacy_send_command(socket_send, socket_recv, "bench_echo", "ping") is not None:
+            samples.append(time.perf_counter() - t0)
+    socket_send.close(linger=0)
+    socket_recv.close(linger=0)
+    context.term()
+    return samples
+
+def bench_event(count, outbound_port, inbound_port):
+    client = AcquilaClient(outbound_port=outbound_port, inbound_port=inbound_port)
+    samples = []
+    for _ in range(count):
+        t0 = time.perf_counter()
+        if client.send_command("bench_echo", "ping") is not None:
+            samples.append(time.perf_counter() - t0)
+    client.close()
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=500, help="round trips per variant")
+    parser.add_argument("--outbound-port", type=int, default=BENCH_OUTBOUND_PORT)
+    parser.add_argument("--inbound-port", type=int, default=BENCH_INBOUND_PORT)
+    args = parser.parse_args()
+
+    results = {}
+    with quiet():
+        server = start_server(args.outbound_port, args.inbound_port)
+        component = AcquilaClient(outbound_port=args.outbound_port, inbound_port=args.inbound_port)
+        threading.Thread(target=component.listen_and_process, args=("bench_echo", echo_logic), daemon=True).start()
+
+        results["legacy"] = summarize_ms(bench_legacy(args.count, args.outbound_port, args.inbound_port))
+        results["event"] = summarize_ms(bench_event(args.count, args.outbound_port, args.inbound_port))
+
+        component.close()
+        server.stop()
+
+    print(f"{'variant':<8} {'n':>6} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, r in results.items():
+        print(f"{name:<8} {r['count']:>6} {r['p50_ms']:>9.3f} {r['p99_ms']:>9.3f} {r['max_ms']:>9.3f}")
+
+if __name__ == "__main__":
+    main()
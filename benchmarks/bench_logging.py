@@ -0,0 +1,42 @@
+"""
+Logging overhead benchmark for the AcquilaServer relay.
+
+Runs the server's per-message handling (see bench_relay.bench_handler) with the
+library logging unconfigured, at INFO, and at DEBUG with the traffic logger
+rate limited and unlimited. Output goes through configure_logging()'s queue to
+os.devnull, so the figures show the cost on the relay thread itself.
+
+    python -m benchmarks.bench_logging --count 100000
+"""
+import argparse
+import logging
+import os
+
+from acquila_zmq.codec import get_codec
+from acquila_zmq.log import configure_logging, stop_logging
+from benchmarks.bench_relay import bench_handler, make_messages
+
+VARIANTS = (
+    ("unconfigured", None),
+    ("INFO", dict(level=logging.INFO)),
+    ("DEBUG 100/s", dict(level=logging.DEBUG, traffic_rate=100.0)),
+    ("DEBUG all", dict(level=logging.DEBUG, traffic_rate=0)),
+)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=100000, help="messages per variant")
+    args = parser.parse_args()
+
+    messages = make_messages(args.count, get_codec("json"))
+    print(f"{'logging':<14} {'msgs/s':>10} {'dropped':>9}")
+    with open(os.devnull, "w") as devnull:
+        for name, options in VARIANTS:
+            handler = configure_logging(stream=devnull, **options) if options else None
+            handled, elapsed = bench_handler(messages, fast_relay=False)
+            stop_logging()
+            dropped = handler.dropped if handler else 0
+            print(f"{name:<14} {handled / elapsed:>10,.0f} {dropped:>9}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Traffic recorder throughput benchmark.
+
+A PUB socket in a child process stands in for a server's outbound socket and
+publishes --count pre-encoded payloads as fast as it can. This process records
+them, either with TrafficRecorder or with the original monitor_zmq.py loop
+(NOBLOCK + sleep(0.1), one flushed text line per message). Reports how many
+messages were recorded and the rate from the first to the last of them.
+
+    python -m benchmarks.bench_recorder --count 200000
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+import zmq
+
+from acquila_zmq.codec import get_codec
+from acquila_zmq.recorder import TrafficRecorder, read_records, segment_paths
+from benchmarks.bench_relay import make_messages
+from benchmarks.common import BENCH_OUTBOUND_PORT, quiet
+
+def _publisher_process(messages, port):
+    context = zmq.Context()
+    pub = context.socket(zmq.PUB)
+    pub.setsockopt(zmq.SNDHWM, 0)
+    pub.bind(f"tcp://127.0.0.1:{port}")
+    time.sleep(0.5) # Let the recorder subscribe
+    for msg in messages:
+        pub.send(msg)
+    pub.close(linger=-1)
+    context.term()
+
+def record_legacy(endpoint, directory, expected, idle_timeout=2.0):
+    """The monitor_zmq.py loop before the recorder, stopped after expected messages or when idle."""
+    socket = zmq.Context.instance().socket(zmq.SUB)
+    socket.connect(endpoint)
+    socket.setsockopt_string(zmq.SUBSCRIBE, "")
+    recorded = 0
+    first = None
+    last = time.monotonic()
+    with open(os.path.join(directory, "zmq_monitor.log"), "w") as f:
+        while recorded < expected and time.monotonic() - last < idle_timeout:
+            try:
+                msg = socket.recv_multipart(flags=zmq.NOBLOCK)[-1].decode("utf-8")
+                timestamp = time.strftime('%H:%M:%S')
+                f.write(f"[{timestamp}] {msg}\n")
+                f.flush()
+                recorded += 1
+                last = time.monotonic()
+                first = first or last
+            except zmq.Again:
+                time.sleep(0.1)
+    socket.close(linger=0)
+    return recorded, (last - first) if first else float("nan")
+
+def record_binary(endpoint, directory, expected, idle_timeout=2.0):
+    recorder = TrafficRecorder(directory, segment_bytes=16 * 1024 * 1024)
+    # Stop when the stream has gone quiet, so dropped messages show up as a short count
+    watchdog = {"count": -1, "since": time.monotonic()}
+    def on_idle():
+        while recorder.running or recorder.recorded == 0:
+            time.sleep(0.2)
+            if recorder.recorded != watchdog["count"]:
+                watchdog.update(count=recorder.recorded, since=time.monotonic())
+            elif time.monotonic() - watchdog["since"] > idle_timeout:
+                recorder.stop()
+                return
+    threading.Thread(target=on_idle, daemon=True).start()
+    recorder.record(endpoint, max_messages=expected)
+    stamps = [t_ns for path in segment_paths(directory) for _, t_ns, _ in read_records(path)]
+    return len(stamps), (stamps[-1] - stamps[0]) / 1e9 if stamps else float("nan")
+
+def bench(recorder, messages, port):
+    endpoint = f"tcp://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as directory:
+        publisher = multiprocessing.Process(target=_publisher_process, args=(messages, port))
+        publisher.start()
+        recorded, elapsed = recorder(endpoint, directory, len(messages))
+        publisher.join()
+    return recorded, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=200000, help="messages published")
+    args = parser.parse_args()
+
+    messages = make_messages(args.count, get_codec("json"))
+    print(f"{'recorder':<10} {'recorded':>10} {'dropped':>9} {'msgs/s':>10}")
+    with quiet():
+        results = [(name, bench(recorder, messages, BENCH_OUTBOUND_PORT))
+                   for name, recorder in (("legacy", record_legacy), ("binary", record_binary))]
+    for name, (recorded, elapsed) in results:
+        print(f"{name:<10} {recorded:>10,} {len(messages) - recorded:>9,} {recorded / elapsed:>10,.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Relay throughput benchmark for AcquilaServer.
+
+A PUB socket in one child process blasts pre-encoded payloads (a
+SENT/RCV/FDB/ACK cycle per command) into the server and a SUB socket in another
+counts what comes out the other side. Reports messages/sec through the relay
+for the default and fast_relay modes, both end-to-end and for the server's
+per-message handling alone (on a single core the end-to-end figure also pays
+for the source and sink processes), and end-to-end for the libzmq proxy mode.
+--callback-us installs an on_message callback that busy-waits that long per
+message, like a slow monitor or GUI.
+
+    python -m benchmarks.bench_relay --count 200000
+    python -m benchmarks.bench_relay --callback-us 50
+"""
+import argparse
+import multiprocessing
+import time
+import uuid
+
+import zmq
+
+from acquila_zmq import AcquilaServer, _create_payload
+from acquila_zmq.codec import get_codec
+from benchmarks.common import BENCH_INBOUND_PORT, BENCH_OUTBOUND_PORT, quiet, start_server
+
+def make_messages(count, codec):
+    messages = []
+    for i in range(count // 4):
+        uuid_val = str(uuid.uuid4())
+        for r_type in ("SENT", "RCV", "FDB", "ACK"):
+            messages.append(codec.encode(_create_payload("motor_X", "", "move_abs", i, "", "", r_type, uuid_val)))
+    return messages
+
+def _sink_process(expected, outbound_port, ready, result):
+    """Counts relayed messages; timed from the first to the last one received."""
+    context = zmq.Context()
+    sink = context.socket(zmq.SUB)
+    sink.setsockopt(zmq.RCVHWM, 0)
+    sink.setsockopt(zmq.RCVTIMEO, 2000)
+    sink.connect(f"tcp://127.0.0.1:{outbound_port}")
+    sink.setsockopt_string(zmq.SUBSCRIBE, "")
+    ready.set()
+
+    received = 0
+    t0 = None
+    try:
+        while received < expected:
+            sink.recv_multipart(copy=False)
+            if t0 is None:
+                t0 = time.perf_counter()
+            received += 1
+    except zmq.Again:
+        pass # Stream stopped early: report what made it through
+    elapsed = time.perf_counter() - t0 if t0 else float("nan")
+    result.put((received, elapsed))
+    sink.close(linger=0)
+    context.term()
+
+def _source_process(messages, inbound_port):
+    context = zmq.Context()
+    source = context.socket(zmq.PUB)
+    source.setsockopt(zmq.SNDHWM, 0)
+    source.connect(f"tcp://127.0.0.1:{inbound_port}")
+    time.sleep(0.5) # Slow-joiner grace period
+    for msg in messages:
+        source.send(msg)
+    source.close(linger=-1)
+    context.term()
+
+def slow_callback(callback_us):
+    """on_message callback spending callback_us microseconds per message, or None."""
+    if not callback_us:
+        return None
+    def on_message(msg):
+        end = time.perf_counter() + callback_us / 1e6
+        while time.perf_counter() < end:
+            pass
+    return on_message
+
+def bench_mode(messages, fast_relay, outbound_port, inbound_port, topics=False, proxy=False, on_message=None):
+    """Server in this process; source and sink in their own processes so they do not share its GIL."""
+    context = None
+    if proxy: # The proxy's sockets are created inside start(), so set the default for them
+        context = zmq.Context()
+        context.setsockopt(zmq.SNDHWM, 0)
+    server = start_server(outbound_port, inbound_port, on_message, fast_relay=fast_relay, topics=topics, proxy=proxy,
+                          context=context)
+    if not proxy:
+        server.socket_out.setsockopt(zmq.SNDHWM, 0) # Measure the relay, not PUB drop behaviour
+    ready = multiprocessing.Event()
+    result = multiprocessing.Queue()
+    sink = multiprocessing.Process(target=_sink_process, args=(len(messages), outbound_port, ready, result))
+    sink.start()
+    ready.wait()
+    source = multiprocessing.Process(target=_source_process, args=(messages, inbound_port))
+    source.start()
+    received, elapsed = result.get()
+    source.join()
+    sink.join()
+    server.stop()
+    time.sleep(0.2)
+    return received, elapsed
+
+def bench_handler(messages, fast_relay, topics=False, on_message=None):
+    """
+    Server-side cost only: feeds already-received frames through the server's
+    per-message handler and an inproc PUB, i.e. the single-core relay capacity.
+    """
+    server = AcquilaServer(fast_relay=fast_relay, topics=topics)
+    server.on_message_callback = on_message
+    server.socket_out = server.context.socket(zmq.PUB)
+    server.socket_out.bind(f"inproc://bench-relay-{uuid.uuid4()}")
+    batch = [[zmq.Frame(msg)] for msg in messages] # As received with copy=False
+    handle = server._handle_fast if fast_relay else server._handle
+
+    t0 = time.perf_counter()
+    for frames in batch:
+        handle(frames)
+    elapsed = time.perf_counter() - t0
+    server.stop()
+    return len(batch), elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=200000, help="messages per mode")
+    parser.add_argument("--codec", default="json")
+    parser.add_argument("--topics", action="store_true", help="run the server in topic mode (skips proxy mode)")
+    parser.add_argument("--repeat", type=int, default=3, help="relay-only runs per mode, best reported")
+    parser.add_argument("--callback-us", type=float, default=0.0, help="on_message cost per message")
+    parser.add_argument("--outbound-port", type=int, default=BENCH_OUTBOUND_PORT)
+    parser.add_argument("--inbound-port", type=int, default=BENCH_INBOUND_PORT)
+    args = parser.parse_args()
+
+    messages = make_messages(args.count, get_codec(args.codec))
+    on_message = slow_callback(args.callback_us)
+    modes = (("default", False), ("fast", True))
+    # Relay-only runs alternate between the modes so that both see the same machine noise
+    handler = {}
+    with quiet():
+        for _ in range(args.repeat):
+            for name, fast in modes:
+                run = bench_handler(messages, fast, args.topics, on_message)
+                handler[name] = min(handler.get(name, run), run, key=lambda r: r[1])
+    print(f"{'mode':<8} {'scope':<10} {'messages':>9} {'seconds':>8} {'msgs/s':>10}")
+    for name, fast in modes:
+        handled, handler_s = handler[name]
+        with quiet():
+            received, elapsed = bench_mode(messages, fast, args.outbound_port, args.inbound_port, args.topics,
+                                           on_message=on_message)
+        print(f"{name:<8} {'relay':<10} {handled:>9} {handler_s:>8.2f} {handled / handler_s:>10,.0f}")
+        print(f"{name:<8} {'end-to-end':<10} {received:>9} {elapsed:>8.2f} {received / elapsed:>10,.0f}")
+    if not args.topics:
+        with quiet():
+            received, elapsed = bench_mode(messages, False, args.outbound_port, args.inbound_port, proxy=True,
+                                           on_message=on_message)
+        print(f"{'proxy':<8} {'end-to-end':<10} {received:>9} {elapsed:>8.2f} {received / elapsed:>10,.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Sharding benchmark.
+
+Two component groups (motor_* and detector_*) of --components echo components
+each, with --senders sender processes per group sending --commands commands to
+their own group (--concurrency at a time). Everything runs in its own process
+on loopback. The bus is served first by one AcquilaServer, then by two shards
+splitting the groups. Reports commands/s for the whole bus, round-trip
+percentiles and the CPU % of every server process.
+
+    python -m benchmarks.bench_shard --components 2 --senders 2 --commands 2000
+"""
+import argparse
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from acquila_zmq.shard import ShardedClient, ShardMap, serve_shard
+from benchmarks.bench_suite import process_cpu_s
+from benchmarks.common import BENCH_OUTBOUND_PORT, quiet, summarize_ms
+
+GROUPS = ("motor", "detector")
+
+def shard_maps():
+    """The one-shard and the two-shard map of the same bus."""
+    def endpoints(offset):
+        return {"outbound": f"tcp://127.0.0.1:{BENCH_OUTBOUND_PORT + offset}",
+                "inbound": f"tcp://127.0.0.1:{BENCH_OUTBOUND_PORT + offset + 1}"}
+    single = {"shards": {"bus": dict(endpoints(0), components=["*"])}}
+    split = {"shards": {group: dict(endpoints(10 * i), components=[f"{group}_*"]) for i, group in enumerate(GROUPS)}}
+    return [("1 shard", single), ("2 shards", split)]
+
+def component_names(group, count):
+    return [f"{group}_{i}" for i in range(count)]
+
+def _server_process(shard_map, name):
+    with quiet():
+        serve_shard(ShardMap.from_dict(shard_map), name)
+
+def _component_process(shard_map, name):
+    with quiet():
+        ShardedClient(shard_map=shard_map).listen_and_process(name, lambda client, data: data.get("arg1"))
+
+def _sender_process(shard_map, names, config, start, results):
+    with quiet():
+        client = ShardedClient(shard_map=shard_map)
+        for name in names: # Connect and make sure every component answers before the clock starts
+            while client.send_command(name, "warmup", wait_for="ACK", timeout_ms=250) is None:
+                pass
+        start.wait()
+
+        def one(i):
+            t0 = time.perf_counter()
+            reply = client.send_command(names[i % len(names)], "echo", arg1=str(i), timeout_ms=5000)
+            return time.perf_counter() - t0 if reply is not None else None
+
+        with ThreadPoolExecutor(max_workers=config["concurrency"]) as pool:
+            samples = list(pool.map(one, range(config["commands"])))
+        client.close()
+        results.put(samples)
+
+def run(shard_map, config):
+    servers = {name: multiprocessing.Process(target=_server_process, args=(shard_map, name), daemon=True)
+               for name in shard_map["shards"]}
+    for proc in servers.values():
+        proc.start()
+    time.sleep(0.5)
+    children = []
+    for group in GROUPS:
+        children += [multiprocessing.Process(target=_component_process, args=(shard_map, name), daemon=True)
+                     for name in component_names(group, config["components"])]
+    start = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    for group in GROUPS:
+        names = component_names(group, config["components"])
+        children += [multiprocessing.Process(target=_sender_process, args=(shard_map, names, config, start, results),
+                                             daemon=True) for _ in range(config["senders"])]
+    for proc in children:
+        proc.start()
+    time.sleep(1.0) # Components subscribe and senders warm up
+
+    cpu0 = {name: process_cpu_s(proc.pid) for name, proc in servers.items()}
+    t0 = time.perf_counter()
+    start.set()
+    samples = []
+    for _ in range(config["senders"] * len(GROUPS)):
+        samples += results.get()
+    elapsed = time.perf_counter() - t0
+    cpu = {name: process_cpu_s(proc.pid) for name, proc in servers.items()}
+
+    for proc in children + list(servers.values()):
+        proc.terminate()
+        proc.join()
+    replies = [s for s in samples if s is not None]
+    server_cpu = {name: (cpu[name] - cpu0[name]) / elapsed * 100 if cpu[name] is not None else None for name in cpu}
+    return len(replies) / elapsed, len(samples) - len(replies), summarize_ms(replies), server_cpu
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--components", type=int, default=2, help="components per group")
+    parser.add_argument("--senders", type=int, default=2, help="sender processes per group")
+    parser.add_argument("--commands", type=int, default=2000, help="commands per sender")
+    parser.add_argument("--concurrency", type=int, default=8, help="commands in flight per sender")
+    config = vars(parser.parse_args())
+
+    print(f"{'bus':<9} {'cmd/s':>8} {'timeouts':>9} {'p50 ms':>7} {'p99 ms':>7}  server CPU %")
+    for label, shard_map in shard_maps():
+        rate, timeouts, summary, server_cpu = run(shard_map, config)
+        cpu = ", ".join(f"{name} {value:.0f}" if value is not None else f"{name} n/a"
+                        for name, value in server_cpu.items())
+        print(f"{label:<9} {rate:>8,.0f} {timeouts:>9} {summary['p50_ms']:>7.2f} {summary['p99_ms']:>7.2f}  {cpu}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Command-state polling benchmark.
+
+Fills an AcquilaServer's command queue with --commands tracked commands, then
+keeps a writer thread pushing new commands through the tracking code
+(SENT/RCV/ACK, evicting the oldest so the queue stays full) while a reader polls
+every --interval-ms milliseconds:
+
+    none         no reader (writer baseline)
+    full copy    list(command_queue.items()) under the lock, as server_gui did
+    snapshot     server.snapshot(last_version), applied to a local mirror
+
+Reports writer throughput and the reader's time per poll; the snapshot reader's
+mirror is checked against the queue at the end.
+
+    python -m benchmarks.bench_snapshot --commands 50000 --seconds 3
+"""
+import argparse
+import threading
+import time
+import uuid
+
+from acquila_zmq import AcquilaServer, _create_payload
+from benchmarks.common import quiet, summarize_ms
+
+def fill(server, count):
+    for _ in range(count):
+        track_command(server)
+
+def track_command(server):
+    uuid_val = str(uuid.uuid4())
+    data = _create_payload("motor_X", "", "move_abs", "10", "", "", "SENT", uuid_val)
+    server._track("SENT", uuid_val, data, "bench")
+    server._track("RCV", uuid_val, None, None)
+    server._track("ACK", uuid_val, {"reply": "done"}, None)
+
+def read_full(server, state):
+    with server.lock:
+        items = list(server.command_queue.items())
+    return len(items)
+
+def read_snapshot(server, state):
+    snap = server.snapshot(state.get("version", 0))
+    mirror = state.setdefault("mirror", {})
+    if snap.full:
+        mirror.clear()
+    mirror.update(snap.changed)
+    for uuid_val in snap.removed:
+        mirror.pop(uuid_val, None)
+    state["version"] = snap.version
+    return len(snap.changed) + len(snap.removed)
+
+READERS = (("none", None), ("full copy", read_full), ("snapshot", read_snapshot))
+
+def bench_reader(commands, seconds, interval_s, reader):
+    server = AcquilaServer(max_commands=commands, finished_ttl=3600.0)
+    fill(server, commands)
+    state = {}
+    if reader is read_snapshot:
+        reader(server, state) # Initial full snapshot, as a freshly opened monitor would take
+
+    stop = threading.Event()
+    written = [0]
+
+    def writer():
+        while not stop.is_set():
+            track_command(server)
+            written[0] += 1
+
+    writer_thread = threading.Thread(target=writer, daemon=True)
+    poll_times = []
+    rows = 0
+    start = time.perf_counter()
+    writer_thread.start()
+    while time.perf_counter() - start < seconds:
+        time.sleep(interval_s)
+        if reader is not None:
+            t0 = time.perf_counter()
+            rows += reader(server, state)
+            poll_times.append(time.perf_counter() - t0)
+    stop.set()
+    writer_thread.join()
+    elapsed = time.perf_counter() - start
+
+    if reader is read_snapshot:
+        read_snapshot(server, state)
+        expected = {u: dict(e) for u, e in server.command_queue.items()}
+        assert state["mirror"] == expected, "snapshot mirror diverged from the command queue"
+    return written[0] / elapsed, poll_times, rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--commands", type=int, default=50000, help="tracked commands")
+    parser.add_argument("--seconds", type=float, default=3.0, help="duration per reader")
+    parser.add_argument("--interval-ms", type=float, default=10.0, help="reader poll interval")
+    args = parser.parse_args()
+
+    print(f"{'reader':<10} {'writes/s':>10} {'polls':>6} {'rows/poll':>10} {'poll p50 ms':>12} {'poll p99 ms':>12}")
+    with quiet():
+        results = [(name, bench_reader(args.commands, args.seconds, args.interval_ms / 1000.0, reader))
+                   for name, reader in READERS]
+    for name, (rate, poll_times, rows) in results:
+        if poll_times:
+            stats = summarize_ms(poll_times)
+            print(f"{name:<10} {rate:>10,.0f} {stats['count']:>6} {rows / stats['count']:>10,.0f} "
+                  f"{stats['p50_ms']:>12.2f} {stats['p99_ms']:>12.2f}")
+        else:
+            print(f"{name:<10} {rate:>10,.0f} {'-':>6} {'-':>10} {'-':>12} {'-':>12}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Load benchmark for the whole bus: one in-process AcquilaServer, --components
+echo components running listen_and_process and --senders clients each sending
+--commands commands round-robin to the components (--concurrency at a time per
+sender). Reports:
+
+  * SENT -> ACK round-trip percentiles
+  * commands/s and messages/s through the relay (SENT, RCV and ACK per command)
+  * CPU seconds and CPU % of the server process and of every child process
+  * command_queue size and resident memory before and after the run
+
+With --processes the components and senders run in child processes, otherwise
+as threads next to the server. --transport picks tcp (loopback), ipc (Unix
+domain sockets) or inproc (threads only). --json writes the results (and the
+configuration) as one JSON document for regression tracking:
+
+    python -m benchmarks.bench_suite --components 4 --senders 4 --json results.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from acquila_zmq import AcquilaClient
+from benchmarks.common import BENCH_INBOUND_PORT, BENCH_OUTBOUND_PORT, quiet, start_server, summarize_ms
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+def rss_mb():
+    """Peak resident set size of this process in MB, None where it cannot be read."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def process_cpu_s(pid):
+    """CPU seconds (user + system) used so far by another process; None where /proc is unavailable."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def echo_logic(client, command_data):
+    return command_data.get("arg1")
+
+def component_names(count):
+    return [f"bench_comp_{i}" for i in range(count)]
+
+def client_options(config):
+    return dict(outbound_port=config["outbound_port"], inbound_port=config["inbound_port"],
+                topics=config["topics"], codec=config["codec"])
+
+def run_component(name, config, ready=None):
+    client = AcquilaClient(**client_options(config))
+    if ready is not None:
+        ready.set()
+    client.listen_and_process(name, echo_logic)
+
+def _component_process(name, config, ready):
+    with quiet():
+        run_component(name, config, ready)
+
+def run_sender(index, config):
+    """Sends the commands of one sender; returns (round-trip seconds, timeouts, CPU seconds)."""
+    names = component_names(config["components"])
+    client = AcquilaClient(**client_options(config))
+    cpu0 = time.process_time()
+
+    def one(i):
+        t0 = time.perf_counter()
+        reply = client.send_command(names[(index + i) % len(names)], "echo", arg1=str(i), timeout_ms=5000)
+        return time.perf_counter() - t0 if reply is not None else None
+
+    with ThreadPoolExecutor(max_workers=config["concurrency"]) as pool:
+        results = list(pool.map(one, range(config["commands"])))
+    client.close()
+    samples = [r for r in results if r is not None]
+    return samples, len(results) - len(samples), time.process_time() - cpu0
+
+def _sender_process(index, config, start, results):
+    with quiet():
+        start.wait()
+        results.put((index, run_sender(index, config)))
+
+def warm_up(config):
+    """Makes sure every component is subscribed before the clock starts."""
+    client = AcquilaClient(**client_options(config))
+    for name in component_names(config["components"]):
+        for _ in range(20):
+            if client.send_command(name, "warmup", wait_for="ACK", timeout_ms=250) is not None:
+                break
+        else:
+            raise RuntimeError(f"Component {name} did not answer")
+    client.close()
+
+def transport_endpoints(transport, outbound_port, inbound_port):
+    """(outbound, inbound) addresses for the server and clients of one run."""
+    if transport == "ipc":
+        directory = tempfile.gettempdir()
+        return (f"ipc://{directory}/acquila_bench_{outbound_port}", f"ipc://{directory}/acquila_bench_{inbound_port}")
+    if transport == "inproc":
+        return f"inproc://acquila_bench_{outbound_port}", f"inproc://acquila_bench_{inbound_port}"
+    return outbound_port, inbound_port
+
+def run_suite(config):
+    results = {"config": dict(config), "platform": platform.platform(), "python": platform.python_version()}
+    server = start_server(config["outbound_port"], config["inbound_port"], fast_relay=config["fast_relay"],
+                          topics=config["topics"])
+    queue_before = len(server.command_queue)
+    rss_before = rss_mb()
+
+    children = []
+    names = component_names(config["components"])
+    if config["processes"]:
+        for name in names:
+            ready = multiprocessing.Event()
+            proc = multiprocessing.Process(target=_component_process, args=(name, config, ready), daemon=True)
+            proc.start()
+            ready.wait()
+            children.append(proc)
+    else:
+        for name in names:
+            ready = threading.Event()
+            threading.Thread(target=run_component, args=(name, config, ready), daemon=True).start()
+            ready.wait()
+    warm_up(config)
+
+    cpu0 = time.process_time()
+    t0 = time.perf_counter()
+    component_cpu0 = [process_cpu_s(proc.pid) for proc in children]
+    if config["processes"]:
+        start = multiprocessing.Event()
+        queue = multiprocessing.Queue()
+        senders = [multiprocessing.Process(target=_sender_process, args=(i, config, start, queue))
+                   for i in range(config["senders"])]
+        for proc in senders:
+            proc.start()
+        time.sleep(0.5) # Let the sender processes connect before the clock matters
+        t0 = time.perf_counter()
+        cpu0 = time.process_time()
+        start.set()
+        sender_results = dict(queue.get() for _ in senders)
+        for proc in senders:
+            proc.join()
+    else:
+        with ThreadPoolExecutor(max_workers=config["senders"]) as pool:
+            sender_results = dict(enumerate(pool.map(lambda i: run_sender(i, config), range(config["senders"]))))
+    elapsed = time.perf_counter() - t0
+    server_cpu = time.process_time() - cpu0
+
+    samples = [s for r in sender_results.values() for s in r[0]]
+    completed = len(samples)
+    results.update({
+        "elapsed_s": elapsed,
+        "commands": completed,
+        "timeouts": sum(r[1] for r in sender_results.values()),
+        "commands_per_s": completed / elapsed,
+        "relay_msgs_per_s": 3 * completed / elapsed,
+        "round_trip": summarize_ms(samples),
+        "cpu": {"server_process_s": server_cpu, "server_process_pct": 100.0 * server_cpu / elapsed},
+        "command_queue": {"before": queue_before, "after": len(server.command_queue)},
+        "rss_mb": {"before": rss_before, "after": rss_mb()},
+    })
+    if config["processes"]:
+        results["cpu"]["senders_s"] = [sender_results[i][2] for i in sorted(sender_results)]
+        results["cpu"]["components_s"] = [
+            None if before is None or after is None else after - before
+            for before, after in zip(component_cpu0, (process_cpu_s(proc.pid) for proc in children))]
+
+    for proc in children:
+        proc.terminate()
+    server.stop()
+    return results
+
+def print_results(r):
+    rtt = r["round_trip"]
+    print(f"commands     {r['commands']:,} in {r['elapsed_s']:.2f} s ({r['timeouts']} timed out)")
+    print(f"throughput   {r['commands_per_s']:,.0f} commands/s, {r['relay_msgs_per_s']:,.0f} relayed msgs/s")
+    print(f"round trip   p50 {rtt['p50_ms']:.3f} ms, p99 {rtt['p99_ms']:.3f} ms, max {rtt['max_ms']:.3f} ms")
+    print(f"server CPU   {r['cpu']['server_process_s']:.2f} s ({r['cpu']['server_process_pct']:.0f}%)")
+    if "senders_s" in r["cpu"]:
+        print(f"sender CPU   {', '.join(f'{s:.2f} s' for s in r['cpu']['senders_s'])}")
+    if any(s is not None for s in r["cpu"].get("components_s", [])):
+        print(f"comp. CPU    {', '.join(f'{s:.2f} s' for s in r['cpu']['components_s'] if s is not None)}")
+    print(f"queue        {r['command_queue']['before']:,} -> {r['command_queue']['after']:,} entries")
+    if r["rss_mb"]["after"] is not None:
+        print(f"peak RSS     {r['rss_mb']['before']:.1f} -> {r['rss_mb']['after']:.1f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--components", type=int, default=4)
+    parser.add_argument("--senders", type=int, default=4)
+    parser.add_argument("--commands", type=int, default=2000, help="commands per sender")
+    parser.add_argument("--concurrency", type=int, default=1, help="commands in flight per sender")
+    parser.add_argument("--processes", action="store_true", help="run components and senders in child processes")
+    parser.add_argument("--fast-relay", action="store_true")
+    parser.add_argument("--topics", action="store_true")
+    parser.add_argument("--codec", default="json")
+    parser.add_argument("--transport", choices=("tcp", "ipc", "inproc"), default="tcp")
+    parser.add_argument("--outbound-port", type=int, default=BENCH_OUTBOUND_PORT)
+    parser.add_argument("--inbound-port", type=int, default=BENCH_INBOUND_PORT)
+    parser.add_argument("--json", metavar="PATH", help="write the results as JSON ('-' for stdout)")
+    args = parser.parse_args()
+
+    if args.transport == "inproc" and args.processes:
+        parser.error("--transport inproc only works within one process; drop --processes")
+    config = {key: value for key, value in vars(args).items() if key != "json"}
+    config["outbound_port"], config["inbound_port"] = transport_endpoints(args.transport, args.outbound_port,
+                                                                          args.inbound_port)
+    with quiet():
+        results = run_suite(config)
+
+    if args.json == "-":
+        json.dump(results, sys.stdout, indent=2)
+        print()
+        return
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {os.path.abspath(args.json)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Shared helpers for the benchmark scripts.
+"""
+import contextlib
+import io
+import logging
+import threading
+import time
+
+from acquila_zmq import AcquilaServer
+
+BENCH_OUTBOUND_PORT = 7555
+BENCH_INBOUND_PORT = 7556
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return float("nan")
+    rank = int(round(pct / 100.0 * (len(sorted_values) - 1)))
+    return sorted_values[rank]
+
+def summarize_ms(samples_s):
+    """Returns p50/p99/max in milliseconds for a list of durations in seconds."""
+    values = sorted(s * 1000.0 for s in samples_s)
+    return {
+        "count": len(values),
+        "p50_ms": percentile(values, 50),
+        "p99_ms": percentile(values, 99),
+        "max_ms": values[-1] if values else float("nan"),
+    }
+
+def start_server(outbound_port=BENCH_OUTBOUND_PORT, inbound_port=BENCH_INBOUND_PORT, on_message=None, **kwargs):
+    """Starts an AcquilaServer on a daemon thread and returns it."""
+    server = AcquilaServer(outbound_port=outbound_port, inbound_port=inbound_port, **kwargs)
+    threading.Thread(target=server.start, args=(on_message,), daemon=True).start()
+    time.sleep(0.2)
+    return server
+
+@contextlib.contextmanager
+def quiet():
+    """Silences the library's log output and stray prints while a benchmark runs."""
+    lib_logger = logging.getLogger("acquila_zmq")
+    previous = lib_logger.level
+    lib_logger.setLevel(logging.CRITICAL)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        lib_logger.setLevel(previous)
@@ -1,5 +1,5 @@
 import time
-from acquila_zmq import AcquilaClient
+from acquila_zmq import AcquilaClient, configure_logging
 
 def motor_logic(client, command_data):
     """
@@ -26,5 +26,9 @@ def motor_logic(client, command_data):
         return "Unknown Command"
 
 # Start the component
+configure_logging()
 client = AcquilaClient()
-client.listen_and_process(physical_name="motor_X", callback_function=motor_logic)
+# max_workers: a move_long no longer blocks status_get while it runs;
+# ordering_key: moves still run one at a time, in the order they arrive
+client.listen_and_process(physical_name="motor_X", callback_function=motor_logic, max_workers=4,
+                          ordering_key=lambda d: "move" if d.get("command") == "move_long" else None)
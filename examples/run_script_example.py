@@ -1,9 +1,12 @@
-from acquila_zmq import AcquilaClient
+import logging
+from acquila_zmq import AcquilaClient, configure_logging
 
+# DEBUG on the traffic logger shows every reply as it arrives
+configure_logging(traffic_level=logging.DEBUG)
 client = AcquilaClient()
 
 print("--- TEST 1: Long Running Command with Feedback ---")
-# This will print "Moving... 1/3", "Moving... 2/3" etc. as they arrive
+# This will log "Moving... 1/3", "Moving... 2/3" etc. as they arrive
 # Increase timeout to 10 seconds since it's a 'long_running' command
 reply = client.send_command("motor_X", "move_long", wait_for="ACK", timeout_ms=10000)
 
@@ -1,4 +1,5 @@
-from acquila_zmq import AcquilaServer
+from acquila_zmq import AcquilaServer, configure_logging
 
+configure_logging()
 server = AcquilaServer()
 server.start()
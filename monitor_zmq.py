@@ -1,24 +1,40 @@
 import zmq
-import json
 import time
+import argparse
+from acquila_zmq import configure_logging
+from acquila_zmq.recorder import TrafficRecorder
 
-def monitor():
+def monitor(endpoint="tcp://127.0.0.1:5555"):
     context = zmq.Context()
     socket = context.socket(zmq.SUB)
-    socket.connect("tcp://127.0.0.1:5555")
+    socket.connect(endpoint)
     socket.setsockopt_string(zmq.SUBSCRIBE, "")
-    print("Monitoring ZMQ on port 5555...")
-    
-    with open("zmq_monitor.log", "w") as f:
+    print(f"Monitoring ZMQ on {endpoint}...")
+
+    with open("zmq_monitor.log", "a") as f:
         while True:
-            try:
-                msg = socket.recv_string(flags=zmq.NOBLOCK)
-                timestamp = time.strftime('%H:%M:%S')
-                f.write(f"[{timestamp}] {msg}\n")
-                f.flush()
-                print(f"[{timestamp}] Received message")
-            except zmq.Again:
-                time.sleep(0.1)
+            # Last frame is the body, also for servers running with topics=True
+            msg = socket.recv_multipart()[-1].decode("utf-8", errors="replace")
+            timestamp = time.strftime('%H:%M:%S')
+            f.write(f"[{timestamp}] {msg}\n")
+            f.flush()
+            print(f"[{timestamp}] Received message")
+
+def record(directory, endpoint="tcp://127.0.0.1:5555", segment_mb=64):
+    """Binary recording of everything the server publishes; see acquila_zmq.recorder."""
+    configure_logging()
+    recorder = TrafficRecorder(directory, segment_bytes=segment_mb * 1024 * 1024)
+    recorder.record(endpoint)
 
 if __name__ == "__main__":
-    monitor()
+    parser = argparse.ArgumentParser(description="Log or record the traffic an Acquila server publishes.")
+    parser.add_argument("--endpoint", default="tcp://127.0.0.1:5555", help="server outbound endpoint")
+    parser.add_argument("--record", metavar="DIR",
+                        help="write binary, rotating segment files to DIR instead of zmq_monitor.log")
+    parser.add_argument("--segment-mb", type=int, default=64, help="segment size for --record")
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.record, args.endpoint, args.segment_mb)
+    else:
+        monitor(args.endpoint)
@@ -3,54 +3,77 @@ import json
 import time
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                              QLabel, QLineEdit, QPushButton, QTableWidget, QTableWidgetItem, 
-                             QHeaderView, QFileDialog, QGroupBox, QStatusBar, QComboBox)
+                             QHeaderView, QFileDialog, QGroupBox, QStatusBar, QComboBox, QSpinBox)
 from PyQt6.QtCore import Qt, QThread, pyqtSignal
-from acquila_zmq import AcquilaClient, DEFAULT_OUTBOUND_PORT, DEFAULT_INBOUND_PORT
+from acquila_zmq import client_pool, DEFAULT_OUTBOUND_PORT, DEFAULT_INBOUND_PORT, configure_logging
 
 class ScriptWorker(QThread):
+    """
+    Runs a script through AcquilaClient.send_batch with up to max_in_flight
+    steps outstanding (1 = strictly one after the other). A row with an empty
+    component and the command BARRIER makes the next step wait until every
+    earlier step has completed, and every later step wait for that one.
+    """
     finished = pyqtSignal()
     status_update = pyqtSignal(str)
     
-    def __init__(self, connection_info, script_data):
+    def __init__(self, connection_info, script_data, max_in_flight=1):
         super().__init__()
         self.conn_info = connection_info # (ip, in_port, out_port)
         self.script_data = script_data
+        self.max_in_flight = max_in_flight
         self._is_running = True
 
     def run(self):
-        # Create a thread-local client
+        # Check a client out of the pool for this run; it is reused by the next one
         ip, i_port, o_port = self.conn_info
         try:
-            client = AcquilaClient(server_ip=ip, inbound_port=i_port, outbound_port=o_port)
+            client = client_pool.acquire(server_ip=ip, inbound_port=i_port, outbound_port=o_port)
         except Exception as e:
             self.status_update.emit(f"Connection Error: {e}")
             self.finished.emit()
             return
 
-        for i, cmd_data in enumerate(self.script_data):
-            if not self._is_running: break
+        try:
+            self.run_steps(client)
+        finally:
+            client_pool.release(client)
             
+        self.status_update.emit("Script Finished.")
+        self.finished.emit()
+
+    def run_steps(self, client):
+        commands = []
+        rows = [] # Script row of each command, for status messages
+        barrier = False
+        for i, cmd_data in enumerate(self.script_data):
             comp = cmd_data.get("component")
             cmd = cmd_data.get("command")
-            a1 = cmd_data.get("arg1", "")
-            a2 = cmd_data.get("arg2", "")
+            if not comp and cmd and cmd.strip().upper() == "BARRIER":
+                barrier = True
+                continue
+            if not (comp and cmd):
+                continue
+
             wf = cmd_data.get("wait_for", "ACK")
-            
             if not wf or wf.strip() == "": wf = "ACK"
+            commands.append({"component": comp, "command": cmd, "arg1": cmd_data.get("arg1", ""),
+                             "arg2": cmd_data.get("arg2", ""), "wait_for": wf, "barrier": barrier})
+            rows.append(i)
+            barrier = False
 
-            self.status_update.emit(f"Step {i+1}: {cmd} -> {comp} (Wait: {wf})")
-            
-            if comp and cmd:
-                try:
-                    # send_command will block until the wait_for condition is met
-                    res = client.send_command(comp, cmd, a1, a2, wait_for=wf)
-                    if res is None and wf != "no wait":
-                        self.status_update.emit(f"Timeout/Failure in step {i+1}")
-                except Exception as e:
-                    self.status_update.emit(f"Error in step {i+1}: {e}")
-            
-        self.status_update.emit("Script Finished.")
-        self.finished.emit()
+        try:
+            # send_batch yields each step as its wait_for condition is met
+            for result in client.send_batch(commands, max_in_flight=self.max_in_flight):
+                step = commands[result.index]
+                row = rows[result.index] + 1
+                if result.status in ("ERR", "TIMEOUT", "SKIPPED"):
+                    self.status_update.emit(f"{result.status} in step {row}: {step['command']} -> {step['component']}")
+                else:
+                    self.status_update.emit(f"Step {row}: {step['command']} -> {step['component']} ({result.status})")
+                if not self._is_running: break
+        except Exception as e:
+            self.status_update.emit(f"Script error: {e}")
 
     def stop(self):
         self._is_running = False
@@ -153,6 +176,12 @@ class ScriptRunnerGUI(QMainWindow):
         save_btn.clicked.connect(self.save_script)
         script_controls.addWidget(save_btn)
         
+        script_controls.addWidget(QLabel("In flight:"))
+        self.in_flight_spin = QSpinBox()
+        self.in_flight_spin.setRange(1, 256)
+        self.in_flight_spin.setToolTip("Steps sent ahead without waiting; BARRIER rows separate dependent parts")
+        script_controls.addWidget(self.in_flight_spin)
+
         self.run_btn = QPushButton("RUN SCRIPT")
         self.run_btn.setMinimumWidth(120)
         self.run_btn.setStyleSheet("background-color: #4CAF50; color: white; font-weight: bold;")
@@ -173,7 +202,9 @@ class ScriptRunnerGUI(QMainWindow):
             ip = self.ip_edit.text()
             i_port = int(self.in_port_edit.text())
             o_port = int(self.out_port_edit.text())
-            self.client = AcquilaClient(server_ip=ip, inbound_port=i_port, outbound_port=o_port)
+            if self.client:
+                client_pool.release(self.client)
+            self.client = client_pool.acquire(server_ip=ip, inbound_port=i_port, outbound_port=o_port)
             self.statusBar().showMessage(f"Connected to {ip}:{i_port}/{o_port}")
         except Exception as e:
             self.statusBar().showMessage(f"Connection Error: {e}")
@@ -322,7 +353,7 @@ class ScriptRunnerGUI(QMainWindow):
         o_port = int(self.out_port_edit.text())
         conn_info = (ip, i_port, o_port)
 
-        self.worker = ScriptWorker(conn_info, script_data)
+        self.worker = ScriptWorker(conn_info, script_data, self.in_flight_spin.value())
         self.worker.status_update.connect(lambda s: self.statusBar().showMessage(s))
         self.worker.finished.connect(self.on_worker_finished)
         self.worker.start()
@@ -345,6 +376,7 @@ class ScriptRunnerGUI(QMainWindow):
         return item.text() if item else ""
 
 if __name__ == "__main__":
+    configure_logging()
     app = QApplication(sys.argv)
     window = ScriptRunnerGUI()
     window.show()
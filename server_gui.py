@@ -1,20 +1,80 @@
 import sys
-import json
 import time
+import threading
+import collections
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
-                             QLabel, QLineEdit, QPushButton, QTextEdit, QTableWidget, 
-                             QTableWidgetItem, QHeaderView, QSplitter)
-from PyQt6.QtCore import QThread, pyqtSignal, Qt, QTimer
-from acquila_zmq import AcquilaServer, DEFAULT_OUTBOUND_PORT, DEFAULT_INBOUND_PORT
+                             QLabel, QLineEdit, QPushButton, QPlainTextEdit, QTableView, 
+                             QHeaderView, QSplitter)
+from PyQt6.QtCore import QThread, pyqtSignal, Qt, QTimer, QAbstractTableModel, QModelIndex
+from PyQt6.QtGui import QColor
+from acquila_zmq import AcquilaServer, DEFAULT_OUTBOUND_PORT, DEFAULT_INBOUND_PORT, configure_logging
+
+def format_message(data):
+    """One compact log line per bus message."""
+    if "raw" in data:
+        return f"RAW  {data['raw']}"
+    tick = data.get("tick count")
+    stamp = time.strftime('%H:%M:%S', time.localtime(tick / 1000.0)) + f".{int(tick) % 1000:03d}" if tick else "--:--:--.---"
+    target = data.get("comp_phys") or data.get("component", "")
+    line = f"{stamp} {data.get('reply type', ''):<4} {target} {data.get('command', '')}"
+    args = [a for a in (data.get("arg1"), data.get("arg2")) if a]
+    if args:
+        line += f"({', '.join(map(str, args))})"
+    if data.get("reply"):
+        line += f" -> {data['reply']}"
+    return f"{line}  [{str(data.get('UUID', ''))[:8]}]"
+
+class LogBuffer:
+    """
+    Messages waiting to be shown in the log view. Filled on the relay thread,
+    drained by the GUI on a timer, so no Qt event is posted per message.
+
+    When more than max_pending messages are waiting, policy decides what goes:
+    "drop_oldest" keeps the newest, "drop_newest" keeps the oldest, and
+    "sample" keeps every sample_every-th message once the buffer is half full.
+    Whatever is lost is counted and reported with the next drain().
+    """
+    POLICIES = ("drop_oldest", "drop_newest", "sample")
+
+    def __init__(self, max_pending=2000, policy="drop_oldest", sample_every=10):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown log drop policy '{policy}', expected one of {self.POLICIES}")
+        self.max_pending = max_pending
+        self.policy = policy
+        self.sample_every = max(1, sample_every)
+        self.pending = collections.deque()
+        self.dropped = 0 # Since the last drain()
+        self.seen = 0
+        self.lock = threading.Lock()
+
+    def put(self, data):
+        with self.lock:
+            self.seen += 1
+            if self.policy == "sample" and len(self.pending) >= self.max_pending // 2 and self.seen % self.sample_every:
+                self.dropped += 1
+                return
+            if len(self.pending) >= self.max_pending:
+                self.dropped += 1
+                if self.policy == "drop_newest":
+                    return
+                self.pending.popleft()
+            self.pending.append(data)
+
+    def drain(self):
+        """Returns (messages, number dropped) since the previous call."""
+        with self.lock:
+            items, self.pending = self.pending, collections.deque()
+            dropped, self.dropped = self.dropped, 0
+        return items, dropped
 
 class ServerWorker(QThread):
-    message_received = pyqtSignal(dict)
     server_stopped = pyqtSignal()
 
-    def __init__(self, outbound_port, inbound_port):
+    def __init__(self, outbound_port, inbound_port, log_buffer):
         super().__init__()
         self.outbound_port = outbound_port
         self.inbound_port = inbound_port
+        self.log_buffer = log_buffer
         self.server = None
 
     def run(self):
@@ -23,25 +83,146 @@ class ServerWorker(QThread):
         self.server_stopped.emit()
 
     def handle_message(self, data):
-        self.message_received.emit(data)
+        # Shown later by the GUI's log flush timer; copied because the server keeps updating
+        # the dict it queued for a SENT when the command's ACK/ERR arrives
+        self.log_buffer.put(dict(data))
 
     def stop(self):
         if self.server:
             self.server.stop()
 
+class CommandTableModel(QAbstractTableModel):
+    """
+    Rows of the server's command queue, updated from server.snapshot() diffs so
+    that only inserted, changed and removed rows are signalled to the view.
+    """
+    COLUMNS = ["UUID", "Status", "Component", "Command", "Reply", "Added At"]
+    STATUS_COLORS = {"RUNNING": QColor(Qt.GlobalColor.green), "FINISHED": QColor(Qt.GlobalColor.gray)}
+    ERROR_COLOR = QColor(Qt.GlobalColor.red)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.uuids = [] # Row order: oldest first
+        self.rows = {} # UUID -> command entry
+        self.row_of = {} # UUID -> row number
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.uuids)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        uuid_val = self.uuids[index.row()]
+        data = self.rows[uuid_val]
+        column = index.column()
+
+        if role == Qt.ItemDataRole.DisplayRole:
+            if column == 0:
+                return uuid_val
+            if column == 1:
+                return data.get("status", "PENDING")
+            if column == 5:
+                # Format tick count to readable time if available
+                tick = data.get("tick count")
+                return time.strftime('%H:%M:%S', time.localtime(tick/1000.0)) if tick else "N/A"
+            return str(data.get(("component", "command", "reply")[column - 2], ""))
+
+        if role == Qt.ItemDataRole.ForegroundRole and column == 1:
+            if data.get("status") == "FINISHED" and data.get("reply type") == "ERR":
+                return self.ERROR_COLOR
+            return self.STATUS_COLORS.get(data.get("status"))
+        return None
+
+    def clear(self):
+        self.beginResetModel()
+        self.uuids, self.rows, self.row_of = [], {}, {}
+        self.endResetModel()
+
+    def apply_snapshot(self, snap):
+        if snap.full:
+            self.beginResetModel()
+            self.rows = dict(snap.changed)
+            self.uuids = sorted(self.rows, key=lambda u: self.rows[u].get("tick count") or 0)
+            self.row_of = {u: i for i, u in enumerate(self.uuids)}
+            self.endResetModel()
+            return
+
+        # Removals: highest rows first, one signal per contiguous range
+        removed_rows = sorted((self.row_of[u] for u in snap.removed if u in self.row_of), reverse=True)
+        i = 0
+        while i < len(removed_rows):
+            last = first = removed_rows[i]
+            i += 1
+            while i < len(removed_rows) and removed_rows[i] == first - 1:
+                first = removed_rows[i]
+                i += 1
+            self.beginRemoveRows(QModelIndex(), first, last)
+            del self.uuids[first:last + 1]
+            self.endRemoveRows()
+        if snap.removed:
+            for uuid_val in snap.removed:
+                self.rows.pop(uuid_val, None)
+            self.row_of = {u: i for i, u in enumerate(self.uuids)}
+
+        # Updates: one dataChanged spanning the changed rows
+        new_uuids = []
+        changed_rows = []
+        for uuid_val, data in snap.changed.items():
+            row = self.row_of.get(uuid_val)
+            if row is None:
+                new_uuids.append(uuid_val)
+            else:
+                self.rows[uuid_val] = data
+                changed_rows.append(row)
+        if changed_rows:
+            self.dataChanged.emit(self.index(min(changed_rows), 0),
+                                  self.index(max(changed_rows), len(self.COLUMNS) - 1))
+
+        # Inserts: appended oldest first (snapshots list the newest change first)
+        if new_uuids:
+            new_uuids.reverse()
+            first = len(self.uuids)
+            self.beginInsertRows(QModelIndex(), first, first + len(new_uuids) - 1)
+            for uuid_val in new_uuids:
+                self.row_of[uuid_val] = len(self.uuids)
+                self.uuids.append(uuid_val)
+                self.rows[uuid_val] = snap.changed[uuid_val]
+            self.endInsertRows()
+
 class AcquilaServerGUI(QMainWindow):
+    LOG_FLUSH_MS = 100 # How often buffered messages are written to the log view
+    LOG_MAX_PENDING = 2000 # Messages buffered between flushes before the drop policy applies
+    LOG_DROP_POLICY = "drop_oldest" # See LogBuffer.POLICIES
+    LOG_MAX_LINES = 1000 # History kept in the log view
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Acquila ZMQ Server Control")
         self.resize(1000, 700)
         
         self.worker = None
+        self.queue_model = CommandTableModel() # Kept in sync through server.snapshot()
+        self.queue_version = 0
+        self.log_buffer = LogBuffer(self.LOG_MAX_PENDING, self.LOG_DROP_POLICY)
+        self.log_dropped = 0
         self.init_ui()
         
         self.refresh_timer = QTimer()
         self.refresh_timer.timeout.connect(self.update_queue_table)
         self.refresh_timer.start(500)
 
+        self.log_timer = QTimer()
+        self.log_timer.timeout.connect(self.flush_log)
+        self.log_timer.start(self.LOG_FLUSH_MS)
+
         # Auto-start server on launch
         QTimer.singleShot(100, self.start_server)
 
@@ -75,9 +256,10 @@ class AcquilaServerGUI(QMainWindow):
         queue_container = QWidget()
         queue_layout = QVBoxLayout(queue_container)
         queue_layout.addWidget(QLabel("<b>Active Command Queue</b>"))
-        self.queue_table = QTableWidget(0, 6)
-        self.queue_table.setHorizontalHeaderLabels(["UUID", "Status", "Component", "Command", "Reply", "Added At"])
+        self.queue_table = QTableView()
+        self.queue_table.setModel(self.queue_model)
         self.queue_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.queue_table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed) # No per-row measuring
         self.queue_table.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOn) 
         queue_layout.addWidget(self.queue_table)
         splitter.addWidget(queue_container)
@@ -85,10 +267,16 @@ class AcquilaServerGUI(QMainWindow):
         # Bottom: Communication Log
         log_container = QWidget()
         log_layout = QVBoxLayout(log_container)
-        log_layout.addWidget(QLabel("<b>Communication Log (Tunnel)</b>"))
-        self.log_area = QTextEdit()
+        log_header = QHBoxLayout()
+        log_header.addWidget(QLabel("<b>Communication Log (Tunnel)</b>"))
+        log_header.addStretch()
+        self.log_dropped_label = QLabel("")
+        self.log_dropped_label.setStyleSheet("color: #f44336;")
+        log_header.addWidget(self.log_dropped_label)
+        log_layout.addLayout(log_header)
+        self.log_area = QPlainTextEdit()
         self.log_area.setReadOnly(True)
-        self.log_area.document().setMaximumBlockCount(1000) # Limit history to 1000 messages
+        self.log_area.setMaximumBlockCount(self.LOG_MAX_LINES)
         self.log_area.setStyleSheet("background-color: #1e1e1e; color: #d4d4d4; font-family: 'Consolas', 'Courier New';")
         log_layout.addWidget(self.log_area)
         splitter.addWidget(log_container)
@@ -112,8 +300,8 @@ class AcquilaServerGUI(QMainWindow):
             self.log_append("Invalid port numbers.")
             return
 
-        self.worker = ServerWorker(out_port, in_port)
-        self.worker.message_received.connect(self.handle_server_message)
+        self.worker = ServerWorker(out_port, in_port, self.log_buffer)
+        self.queue_version = 0 # New server, new version numbers: start with a full snapshot
         self.worker.server_stopped.connect(self.on_server_stop)
         self.worker.start()
 
@@ -139,65 +327,37 @@ class AcquilaServerGUI(QMainWindow):
         self.in_port_edit.setEnabled(True)
         self.out_port_edit.setEnabled(True)
 
-    def handle_server_message(self, data):
-        # Format JSON for log
-        log_entry = json.dumps(data, indent=2)
-        self.log_append(log_entry)
+    def flush_log(self):
+        """Writes everything buffered since the last flush to the log view in one append."""
+        items, dropped = self.log_buffer.drain()
+        # Lines beyond the view's history would scroll out immediately; skip formatting them
+        hidden = max(0, len(items) - self.LOG_MAX_LINES)
+        for _ in range(hidden):
+            items.popleft()
+        if items:
+            self.log_append("\n".join(format_message(data) for data in items))
+        if dropped or hidden:
+            self.log_dropped += dropped + hidden
+            self.log_dropped_label.setText(f"{self.log_dropped} messages dropped")
 
     def log_append(self, text):
-        self.log_area.append(text)
+        self.log_area.appendPlainText(text)
         # Auto-scroll
         self.log_area.moveCursor(self.log_area.textCursor().MoveOperation.End)
 
     def update_queue_table(self):
         if not self.worker or not self.worker.server:
-            self.queue_table.setRowCount(0)
+            if self.queue_model.rowCount():
+                self.queue_model.clear()
             return
 
-        now = time.time()
-        grace_period = 10.0 # Keep finished commands for 10 seconds
-        
-        # Lock while reading and pruning
-        with self.worker.server.lock:
-            # Prune stale finished commands
-            stale_keys = [k for k, v in self.worker.server.command_queue.items() 
-                         if v.get("status") == "FINISHED" and (now - v.get("finish_time", 0)) > grace_period]
-            for k in stale_keys:
-                del self.worker.server.command_queue[k]
-                
-            queue_items = list(self.worker.server.command_queue.items())
-            
-        self.queue_table.setRowCount(len(queue_items))
-        
-        # Sort so newer/active ones stay together or just display as is
-        for i, (uuid_val, data) in enumerate(queue_items):
-            status = data.get("status", "PENDING")
-            
-            self.queue_table.setItem(i, 0, QTableWidgetItem(str(uuid_val)))
-            
-            # Status Item with color coding
-            status_item = QTableWidgetItem(status)
-            if status == "RUNNING":
-                status_item.setForeground(Qt.GlobalColor.green)
-            elif status == "FINISHED":
-                status_item.setForeground(Qt.GlobalColor.gray)
-                if data.get("reply type") == "ERR":
-                    status_item.setForeground(Qt.GlobalColor.red)
-            self.queue_table.setItem(i, 1, status_item)
-            
-            self.queue_table.setItem(i, 2, QTableWidgetItem(str(data.get("component", ""))))
-            self.queue_table.setItem(i, 3, QTableWidgetItem(str(data.get("command", ""))))
-            self.queue_table.setItem(i, 4, QTableWidgetItem(str(data.get("reply", ""))))
-            
-            # Format tick count to readable time if available
-            tick = data.get("tick count")
-            if tick:
-                readable_time = time.strftime('%H:%M:%S', time.localtime(tick/1000.0))
-            else:
-                readable_time = "N/A"
-            self.queue_table.setItem(i, 5, QTableWidgetItem(readable_time))
+        # Only fetch what changed since the last refresh; the server expires finished commands itself
+        snap = self.worker.server.snapshot(self.queue_version)
+        self.queue_version = snap.version
+        self.queue_model.apply_snapshot(snap)
 
 if __name__ == "__main__":
+    configure_logging()
     app = QApplication(sys.argv)
     window = AcquilaServerGUI()
     window.show()
@@ -8,7 +8,7 @@ import time
 import threading
 
 try:
-    from acquila_zmq import AcquilaServer, AcquilaClient, __version__
+    from acquila_zmq import AcquilaServer, AcquilaClient, __version__, configure_logging
     print(f"✓ Import successful! Version: {__version__}")
 except ImportError as e:
     print(f"✗ Import failed: {e}")
@@ -69,6 +69,7 @@ if __name__ == "__main__":
     print("=" * 50)
     print("Acquila ZMQ Library - Installation Test")
     print("=" * 50)
+    configure_logging()
     
     success = test_communication()
     